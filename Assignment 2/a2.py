@@ -1,13 +1,24 @@
+import bisect
+import base64
+import functools
+import hashlib
+import heapq
+import itertools
 import json
-import pandas as pd
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
 import requests
 import io
-import matplotlib.pyplot as plt
-import geopandas as gpd
-import contextily as ctx
-from flask import Flask, request, send_file
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, send_file
 from flask_restx import Resource, Api, fields
 from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
 
 app = Flask(__name__)
 api = Api(app)
@@ -18,9 +29,6 @@ def parse_date(date_str):
 def parse_time(time_str):
     return datetime.strptime(time_str, "%H:%M:%S").time()
 
-def is_overlapping(start_time1, end_time1, start_time2, end_time2):
-    return start_time1 < end_time2 and start_time2 < end_time1
-
 location_fields = api.model('Location', {
     'street': fields.String,
     'suburb': fields.String,
@@ -40,9 +48,885 @@ event_fields = api.model('Event', {
     'datetime': fields.String(attribute=lambda event: f"{event['date']} {event['start_time']}")
 })
 
-columns = ['id', 'name', 'date', 'start_time', 'end_time', 'location', 'description', 'last_update']
-df = pd.DataFrame(columns=columns)
-df.set_index('id', inplace=True)
+
+class Event:
+    """
+    One stored event. Records are never modified in place, an update stores a new record, so a
+    request reading an event never sees half of a concurrent change.
+    """
+    __slots__ = ('id', 'name', 'date', 'start_time', 'end_time', 'location', 'description', 'last_update')
+
+    def __init__(self, id, name, date, start_time, end_time, location, description, last_update):
+        self.id = id
+        self.name = name
+        self.date = date
+        self.start_time = start_time
+        self.end_time = end_time
+        self.location = location
+        self.description = description
+        self.last_update = last_update
+
+    def replace(self, **changes):
+        values = {attr: getattr(self, attr) for attr in self.__slots__}
+        values.update(changes)
+        return Event(**values)
+
+    def value(self, attr):
+        """
+        :return: attribute in the form it is shown in responses
+        """
+        value = getattr(self, attr)
+        if attr == 'date':
+            return value.strftime("%d-%m-%Y")
+        if attr in ('start_time', 'end_time'):
+            return value.strftime("%H:%M:%S")
+        if attr == 'last_update':
+            return value.strftime("%Y-%m-%d %H:%M:%S")
+        if attr == 'location':
+            return json.loads(value)
+        return value
+
+
+class DaySchedule:
+    """
+    The events of one date ordered by start time. Stored events never overlap, so ordering them by
+    start also orders them by end, and the events that overlap a slot are one contiguous run that
+    two binary searches find.
+    """
+    __slots__ = ('starts', 'ends', 'ids')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def overlapping(self, start_time, end_time):
+        """
+        :return: ids of the events that overlap start_time to end_time, in time order
+        """
+        first = bisect.bisect_right(self.ends, start_time)
+        last = bisect.bisect_left(self.starts, end_time)
+        return self.ids[first:last]
+
+    def add(self, event):
+        i = bisect.bisect_left(self.starts, event.start_time)
+        self.starts.insert(i, event.start_time)
+        self.ends.insert(i, event.end_time)
+        self.ids.insert(i, event.id)
+
+    def remove(self, event):
+        i = self.ids.index(event.id, bisect.bisect_left(self.starts, event.start_time))
+        del self.starts[i], self.ends[i], self.ids[i]
+
+
+class EventConflict(Exception):
+    def __init__(self, events):
+        super().__init__("Event time is overlapping with an existing event.")
+        self.events = events
+
+
+class BatchConflict(Exception):
+    def __init__(self, conflicts):
+        super().__init__(f"{len(conflicts)} events of the batch overlap other events.")
+        self.conflicts = conflicts
+
+
+def check_slot(start_time, end_time):
+    if start_time >= end_time:
+        raise ValueError("'from' must be before 'to'.")
+
+
+def batch_conflicts(slots, stored_on):
+    """
+    Check new events against each other and against the stored events of their dates with one
+    sort and sweep per date. Only one overlap is found per new event, so a batch that overlaps
+    itself everywhere still takes O(n log n).
+    :param slots: list of (date, start_time, end_time) of the new events
+    :param stored_on: function returning the stored events of a date
+    :return: dict of position in slots to {'id': a stored event} or {'index': a new event} it overlaps
+    """
+    by_date = {}
+    for position, (date, start_time, end_time) in enumerate(slots):
+        by_date.setdefault(date, []).append((start_time, end_time, position))
+
+    conflicts = {}
+
+    def record(position, other):
+        if position >= 0 and position not in conflicts:
+            conflicts[position] = {'id': -other} if other < 0 else {'index': other}
+
+    for date, day_slots in by_date.items():
+        # stored events are marked by their negated id, new ones by their position
+        intervals = day_slots + [(event.start_time, event.end_time, -event.id) for event in stored_on(date)]
+        intervals.sort()
+        running = []
+        # new events still running that have not overlapped anything, each leaves it once
+        waiting = set()
+        for start_time, end_time, marker in intervals:
+            while running and running[0][0] <= start_time:
+                waiting.discard(heapq.heappop(running)[1])
+            if running:
+                record(marker, running[0][1])
+                for other in waiting:
+                    record(other, marker)
+                waiting.clear()
+            elif marker >= 0:
+                waiting.add(marker)
+            heapq.heappush(running, (end_time, marker))
+    return conflicts
+
+
+def sort_keys(sorting):
+    """
+    :param sorting: list of (attribute, descending) pairs
+    :return: the pairs with id appended as the final key, in the direction of the first key
+    """
+    return sorting + [('id', sorting[0][1])]
+
+
+def follows(event, sorting, after):
+    """
+    :return: whether event comes after the event whose sort_keys values are after
+    """
+    for (attr, descending), value in zip(sort_keys(sorting), after):
+        own = getattr(event, attr)
+        if own != value:
+            return (own < value) if descending else (own > value)
+    return False
+
+
+def key_text(attr, value):
+    """
+    :return: value of a sort attribute as it is stored in SQLite and written into cursors
+    """
+    if attr == 'last_update':
+        return value.isoformat(sep=' ')
+    if attr in ('date', 'start_time', 'end_time'):
+        return value.isoformat()
+    return value
+
+
+def parse_key_text(attr, text):
+    if attr == 'last_update':
+        return datetime.fromisoformat(text)
+    if attr == 'date':
+        return datetime.fromisoformat(text).date()
+    if attr in ('start_time', 'end_time'):
+        return datetime.strptime(text, "%H:%M:%S").time()
+    return text
+
+
+def encode_cursor(event, sorting):
+    """
+    :return: opaque token for the position after event, it only stays valid for the same order
+    """
+    after = [key_text(attr, getattr(event, attr)) for attr, _ in sort_keys(sorting)]
+    token = json.dumps({"order": sorting, "after": after}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(token.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sorting):
+    """
+    :return: the sort_keys values stored in cursor, None for an empty cursor
+    :raise ValueError: if the cursor is malformed or was made for a different order
+    """
+    if not cursor:
+        return None
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if [tuple(key) for key in token['order']] != sorting:
+            raise ValueError
+        keys = sort_keys(sorting)
+        after = token['after']
+        # one value per key of the type encode_cursor writes, anything else would fail in the store's lookup
+        if not isinstance(after, list) or len(after) != len(keys) \
+                or any(type(text) is not (int if attr == 'id' else str) for (attr, _), text in zip(keys, after)):
+            raise ValueError
+        return [parse_key_text(attr, text) for (attr, _), text in zip(keys, after)]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor for this order.")
+
+
+class EventStore:
+    """
+    Events by id together with a DaySchedule per date, so a lookup does not search and an overlap
+    check is a binary search in the events of one day. For every attribute a sorted list of
+    (value, id) is kept up to date, so a page in any order is read off an index rather than sorted,
+    and a timeline of (date, start_time, id) gives the neighbours of an event. version counts the
+    writes, a response built at one version stays valid until it changes; epoch is new for every
+    store, so the same count in a restarted or replaced store is not taken for the same events.
+    Writes hold a lock so that the store can be shared by the threads of a WSGI server.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._events = {}
+        self._dates = {}
+        self._indexes = {attr: [] for attr in Event.__slots__}
+        self._timeline = []
+        self._next_id = 1
+        self.version = 0
+        self.epoch = os.urandom(8).hex()
+
+    def __len__(self):
+        return len(self._events)
+
+    def release(self):
+        """
+        Nothing is held per thread, release is there to match SQLiteEventStore.
+        """
+
+    def get(self, event_id):
+        return self._events.get(event_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._events.values())
+
+    def overlapping(self, date, start_time, end_time, exclude=None):
+        """
+        :return: events on date whose time overlaps start_time to end_time, apart from the event with id exclude
+        """
+        with self._lock:
+            schedule = self._dates.get(date)
+            if schedule is None:
+                return []
+            return [self._events[event_id] for event_id in schedule.overlapping(start_time, end_time)
+                    if event_id != exclude]
+
+    def create(self, name, date, start_time, end_time, location, description):
+        """
+        Store a new event under the next free id, ids are not reused after a delete.
+        :raise EventConflict: if it overlaps an existing event
+        """
+        check_slot(start_time, end_time)
+        with self._lock:
+            conflicts = self.overlapping(date, start_time, end_time)
+            if conflicts:
+                raise EventConflict(conflicts)
+            event = Event(self._next_id, name, date, start_time, end_time, location, description, datetime.now())
+            self._next_id += 1
+            self._insert(event)
+            return event
+
+    def create_many(self, items):
+        """
+        Store a batch of events, either all of them or none.
+        :param items: list of (name, date, start_time, end_time, location, description)
+        :return: the stored events in the order of items
+        :raise BatchConflict: if events of the batch overlap each other or stored events
+        """
+        for item in items:
+            check_slot(item[2], item[3])
+        with self._lock:
+            conflicts = batch_conflicts([item[1:4] for item in items], self._stored_on)
+            if conflicts:
+                raise BatchConflict(conflicts)
+            now = datetime.now()
+            events = [Event(self._next_id + n, *item, now) for n, item in enumerate(items)]
+            # the indexes are built aside first, so if a value does not compare nothing has been stored;
+            # sorting the two sorted runs together is cheaper than an insert per event
+            indexes = {attr: sorted(index + [(getattr(event, attr), event.id) for event in events])
+                       for attr, index in self._indexes.items()}
+            timeline = sorted(self._timeline + [(event.date, event.start_time, event.id) for event in events])
+            self._indexes = indexes
+            self._timeline = timeline
+            self._next_id += len(events)
+            self.version += 1
+            for event in events:
+                self._events[event.id] = event
+                self._dates.setdefault(event.date, DaySchedule()).add(event)
+            return events
+
+    def _stored_on(self, date):
+        schedule = self._dates.get(date)
+        return [self._events[event_id] for event_id in schedule.ids] if schedule is not None else []
+
+    def update(self, event_id, **changes):
+        """
+        :return: the updated event, or None if there is no event with that id
+        :raise EventConflict: if the changed event overlaps another event
+        """
+        with self._lock:
+            event = self._events.get(event_id)
+            if event is None:
+                return None
+            updated = event.replace(last_update=datetime.now(), **changes)
+            check_slot(updated.start_time, updated.end_time)
+            conflicts = self.overlapping(updated.date, updated.start_time, updated.end_time, exclude=event_id)
+            if conflicts:
+                raise EventConflict(conflicts)
+            self._remove(event)
+            self._insert(updated)
+            return updated
+
+    def delete(self, event_id):
+        """
+        :return: the removed event, or None if there is no event with that id
+        """
+        with self._lock:
+            event = self._events.get(event_id)
+            if event is not None:
+                self._remove(event)
+            return event
+
+    def neighbours(self, event):
+        """
+        :return: the events just before and just after event in (date, start_time, id) order, or None
+        """
+        with self._lock:
+            i = bisect.bisect_left(self._timeline, (event.date, event.start_time, event.id))
+            previous_event = self._events[self._timeline[i - 1][2]] if i > 0 else None
+            # event itself is at i if it is stored
+            j = i + 1 if i < len(self._timeline) and self._timeline[i][2] == event.id else i
+            next_event = self._events[self._timeline[j][2]] if j < len(self._timeline) else None
+            return previous_event, next_event
+
+    def sorted_page(self, sorting, offset, limit):
+        """
+        :param sorting: list of (attribute, descending) pairs, ties are broken as in sort_keys
+        :return: the limit events from offset on in that order, and whether more events follow
+        """
+        with self._lock:
+            events = list(itertools.islice(self._ordered(sorting), offset, offset + limit + 1))
+        return events[:limit], len(events) > limit
+
+    def page_after(self, sorting, after, limit):
+        """
+        :param after: sort_keys values of the last event of the previous page, None for the first page
+        :return: the limit events that follow it in the sorting order, and whether more events follow
+        """
+        with self._lock:
+            events = list(itertools.islice(self._ordered(sorting, after), limit + 1))
+        return events[:limit], len(events) > limit
+
+    def _ordered(self, sorting, after=None):
+        """
+        Generate the events in sorting order, starting after the event with sort_keys values after.
+        The first key is walked on its index, only events equal in it are sorted by the other keys.
+        """
+        attr, descending = sorting[0]
+        index = self._indexes[attr]
+        step = -1 if descending else 1
+        if after is None:
+            i = len(index) - 1 if descending else 0
+        elif len(sorting) == 1:
+            # the index order is (value, id), exactly the order asked for
+            i = bisect.bisect_left(index, (after[0], after[-1])) - 1 if descending \
+                else bisect.bisect_right(index, (after[0], after[-1]))
+        else:
+            i = bisect.bisect_right(index, (after[0], math.inf)) - 1 if descending \
+                else bisect.bisect_left(index, (after[0],))
+
+        while 0 <= i < len(index):
+            if len(sorting) == 1:
+                yield self._events[index[i][1]]
+                i += step
+                continue
+            value = index[i][0]
+            group = []
+            while 0 <= i < len(index) and index[i][0] == value:
+                group.append(self._events[index[i][1]])
+                i += step
+            # the group is in id order already, stable sorts from the last key to the second finish it
+            for other, other_descending in reversed(sorting[1:]):
+                group.sort(key=lambda event: getattr(event, other), reverse=other_descending)
+            if after is not None:
+                group = [event for event in group if follows(event, sorting, after)]
+                after = None
+            yield from group
+
+    def day_counts(self):
+        """
+        :return: dict of date to number of events on that date
+        """
+        with self._lock:
+            return {date: len(schedule) for date, schedule in self._dates.items()}
+
+    def count_between(self, first, last):
+        """
+        :return: number of events dated first to last inclusive, looked up day by day
+        """
+        with self._lock:
+            days = (first + timedelta(days=n) for n in range((last - first).days + 1))
+            return sum(len(self._dates[day]) for day in days if day in self._dates)
+
+    def _insert(self, event):
+        self.version += 1
+        self._events[event.id] = event
+        self._dates.setdefault(event.date, DaySchedule()).add(event)
+        for attr, index in self._indexes.items():
+            bisect.insort(index, (getattr(event, attr), event.id))
+        bisect.insort(self._timeline, (event.date, event.start_time, event.id))
+
+    def _remove(self, event):
+        self.version += 1
+        del self._events[event.id]
+        for attr, index in self._indexes.items():
+            del index[bisect.bisect_left(index, (getattr(event, attr), event.id))]
+        del self._timeline[bisect.bisect_left(self._timeline, (event.date, event.start_time, event.id))]
+        schedule = self._dates[event.date]
+        schedule.remove(event)
+        if not schedule:
+            del self._dates[event.date]
+
+
+class SQLiteEventStore:
+    """
+    The same interface as EventStore over a SQLite database, so events survive a restart. A thread
+    checks a connection out of a pool on first use and gives it back with release, which the app
+    calls at the end of each request; up to pool_size idle connections are kept for the next ones.
+    Sorting, paging and counting run as queries on the indexes and the database is only read as
+    far as a request needs.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            location TEXT NOT NULL,
+            description TEXT NOT NULL,
+            last_update TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS events_date_start ON events (date, start_time);
+        CREATE INDEX IF NOT EXISTS events_last_update ON events (last_update);
+        CREATE INDEX IF NOT EXISTS events_name ON events (name);
+
+        CREATE TABLE IF NOT EXISTS event_days (
+            date TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TRIGGER IF NOT EXISTS event_days_insert AFTER INSERT ON events BEGIN
+            INSERT INTO event_days VALUES (new.date, 1) ON CONFLICT (date) DO UPDATE SET count = count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_days_delete AFTER DELETE ON events BEGIN
+            UPDATE event_days SET count = count - 1 WHERE date = old.date;
+            DELETE FROM event_days WHERE date = old.date AND count = 0;
+        END;
+        CREATE TRIGGER IF NOT EXISTS event_days_update AFTER UPDATE OF date ON events
+        WHEN old.date != new.date BEGIN
+            UPDATE event_days SET count = count - 1 WHERE date = old.date;
+            DELETE FROM event_days WHERE date = old.date AND count = 0;
+            INSERT INTO event_days VALUES (new.date, 1) ON CONFLICT (date) DO UPDATE SET count = count + 1;
+        END;
+
+        CREATE TABLE IF NOT EXISTS store_version (
+            id INTEGER PRIMARY KEY CHECK (id = 0),
+            version INTEGER NOT NULL,
+            epoch TEXT NOT NULL DEFAULT (lower(hex(randomblob(8))))
+        );
+        INSERT OR IGNORE INTO store_version (id, version) VALUES (0, 0);
+        CREATE TRIGGER IF NOT EXISTS store_version_insert AFTER INSERT ON events BEGIN
+            UPDATE store_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS store_version_update AFTER UPDATE ON events BEGIN
+            UPDATE store_version SET version = version + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS store_version_delete AFTER DELETE ON events BEGIN
+            UPDATE store_version SET version = version + 1;
+        END;
+    """
+
+    def __init__(self, path, pool_size=8):
+        self.path = path
+        self._local = threading.local()
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        connection = self._connection()
+        # WAL is a property of the database file, so it is set once here rather than per connection
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(self.SCHEMA)
+        # a database from before the per-day counts were kept gets them counted once
+        if connection.execute("SELECT NOT EXISTS (SELECT 1 FROM event_days) AND EXISTS (SELECT 1 FROM events)").fetchone()[0]:
+            connection.execute("INSERT INTO event_days SELECT date, COUNT(*) FROM events GROUP BY date")
+        # and one from before the epoch was kept gets one, ALTER TABLE only takes a constant default
+        if 'epoch' not in [column[1] for column in connection.execute("PRAGMA table_info(store_version)")]:
+            connection.execute("ALTER TABLE store_version ADD COLUMN epoch TEXT NOT NULL DEFAULT ''")
+            connection.execute("UPDATE store_version SET epoch = lower(hex(randomblob(8)))")
+        # the epoch stays with the file, a new database or a replaced file gets a different one
+        self.epoch = connection.execute("SELECT epoch FROM store_version").fetchone()[0]
+        self.release()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                # autocommit mode, writes open their own transaction; a pooled connection moves
+                # between threads but is only used by one at a time
+                connection = sqlite3.connect(self.path, isolation_level=None, timeout=30, check_same_thread=False)
+                connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def release(self):
+        """
+        Give the connection of this thread back to the pool, or close it if the pool is full.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            return
+        self._local.connection = None
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    @staticmethod
+    def _row(event):
+        # ISO text sorts in date and time order, so the indexes and ORDER BY work on it directly
+        return tuple(key_text(attr, getattr(event, attr)) for attr in Event.__slots__[1:])
+
+    @staticmethod
+    def _event(row):
+        return Event(row[0], *(parse_key_text(attr, text) for attr, text in zip(Event.__slots__[1:], row[1:])))
+
+    def _select(self, where="", parameters=()):
+        rows = self._connection().execute(f"SELECT {', '.join(Event.__slots__)} FROM events {where}", parameters)
+        return [self._event(row) for row in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT COALESCE(SUM(count), 0) FROM event_days").fetchone()[0]
+
+    @property
+    def version(self):
+        # counted by triggers, so writes from other processes on the same file are seen as well
+        return self._connection().execute("SELECT version FROM store_version").fetchone()[0]
+
+    def get(self, event_id):
+        events = self._select("WHERE id = ?", (event_id,))
+        return events[0] if events else None
+
+    def all(self):
+        return self._select("ORDER BY id")
+
+    def overlapping(self, date, start_time, end_time, exclude=None):
+        return self._select("WHERE date = ? AND start_time < ? AND end_time > ? AND id IS NOT ? ORDER BY start_time",
+                            (date.isoformat(), end_time.isoformat(), start_time.isoformat(), exclude))
+
+    def create(self, name, date, start_time, end_time, location, description):
+        check_slot(start_time, end_time)
+        event = Event(None, name, date, start_time, end_time, location, description, datetime.now())
+        connection = self._connection()
+        # IMMEDIATE takes the write lock first, so no other writer can add a conflict after the check
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            conflicts = self.overlapping(date, start_time, end_time)
+            if conflicts:
+                raise EventConflict(conflicts)
+            cursor = connection.execute("INSERT INTO events (name, date, start_time, end_time, location, description, "
+                                        "last_update) VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(event))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return event.replace(id=cursor.lastrowid)
+
+    def create_many(self, items):
+        for item in items:
+            check_slot(item[2], item[3])
+        now = datetime.now()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            conflicts = batch_conflicts([item[1:4] for item in items],
+                                        lambda date: self._select("WHERE date = ?", (key_text('date', date),)))
+            if conflicts:
+                raise BatchConflict(conflicts)
+            events = []
+            for item in items:
+                event = Event(None, *item, now)
+                cursor = connection.execute("INSERT INTO events (name, date, start_time, end_time, location, "
+                                            "description, last_update) VALUES (?, ?, ?, ?, ?, ?, ?)", self._row(event))
+                events.append(event.replace(id=cursor.lastrowid))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return events
+
+    def update(self, event_id, **changes):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            event = self.get(event_id)
+            if event is not None:
+                event = event.replace(last_update=datetime.now(), **changes)
+                check_slot(event.start_time, event.end_time)
+                conflicts = self.overlapping(event.date, event.start_time, event.end_time, exclude=event_id)
+                if conflicts:
+                    raise EventConflict(conflicts)
+                connection.execute("UPDATE events SET name = ?, date = ?, start_time = ?, end_time = ?, location = ?, "
+                                   "description = ?, last_update = ? WHERE id = ?", self._row(event) + (event_id,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return event
+
+    def delete(self, event_id):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            event = self.get(event_id)
+            connection.execute("DELETE FROM events WHERE id = ?", (event_id,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return event
+
+    def neighbours(self, event):
+        # row values compare column by column, so both lookups are one step on the (date, start_time) index
+        position = (key_text('date', event.date), key_text('start_time', event.start_time), event.id)
+        previous_events = self._select("WHERE (date, start_time, id) < (?, ?, ?) "
+                                       "ORDER BY date DESC, start_time DESC, id DESC LIMIT 1", position)
+        next_events = self._select("WHERE (date, start_time, id) > (?, ?, ?) "
+                                   "ORDER BY date, start_time, id LIMIT 1", position)
+        return (previous_events[0] if previous_events else None), (next_events[0] if next_events else None)
+
+    def sorted_page(self, sorting, offset, limit):
+        # attributes are checked against Event.__slots__ by the caller, so they are safe to put in the query
+        order = ', '.join(f"{attr} {'DESC' if descending else 'ASC'}" for attr, descending in sort_keys(sorting))
+        events = self._select(f"ORDER BY {order} LIMIT ? OFFSET ?", (limit + 1, offset))
+        return events[:limit], len(events) > limit
+
+    def page_after(self, sorting, after, limit):
+        order = ', '.join(f"{attr} {'DESC' if descending else 'ASC'}" for attr, descending in sort_keys(sorting))
+        where, parameters = "", []
+        if after is not None:
+            # (a, b, id) after (x, y, z) is a > x, or a = x and b > y, or a = x and b = y and id > z
+            keys = sort_keys(sorting)
+            alternatives = []
+            for n, (attr, descending) in enumerate(keys):
+                terms = [f"{equal} = ?" for equal, _ in keys[:n]] + [f"{attr} {'<' if descending else '>'} ?"]
+                alternatives.append("(" + " AND ".join(terms) + ")")
+                parameters += [key_text(key, value) for (key, _), value in zip(keys[:n + 1], after)]
+            where = "WHERE " + " OR ".join(alternatives)
+        events = self._select(f"{where} ORDER BY {order} LIMIT ?", parameters + [limit + 1])
+        return events[:limit], len(events) > limit
+
+    def day_counts(self):
+        # event_days is kept up to date by triggers on events
+        rows = self._connection().execute("SELECT date, count FROM event_days")
+        return {datetime.fromisoformat(date).date(): count for date, count in rows}
+
+    def count_between(self, first, last):
+        return self._connection().execute("SELECT COALESCE(SUM(count), 0) FROM event_days WHERE date BETWEEN ? AND ?",
+                                          (first.isoformat(), last.isoformat())).fetchone()[0]
+
+
+# set EVENTS_DB to the path of a SQLite file to keep events between runs
+store = SQLiteEventStore(os.environ['EVENTS_DB']) if os.environ.get('EVENTS_DB') else EventStore()
+
+
+@app.teardown_appcontext
+def release_store(exception):
+    # the dev server runs every request on a new thread, so a connection is only reused if it goes back
+    store.release()
+
+# point these at stub_server.py to run without network access
+HOLIDAY_API = os.environ.get('HOLIDAY_API', 'https://date.nager.at')
+WEATHER_API = os.environ.get('WEATHER_API', 'https://www.7timer.info')
+UPSTREAM_TIMEOUT = 5
+# 7timer starts a new forecast run every few hours, a cached forecast is kept until the next one
+WEATHER_RUN_HOURS = 6
+
+http = requests.Session()
+http.mount('http://', HTTPAdapter(pool_maxsize=16))
+http.mount('https://', HTTPAdapter(pool_maxsize=16))
+fetch_pool = ThreadPoolExecutor(max_workers=16)
+
+
+class TTLCache:
+    """
+    Thread safe dict whose entries expire ttl seconds after they were loaded. Failed loads are not
+    cached. Two requests missing the same key at once both load it, which is harmless here.
+    """
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = load()
+        with self._lock:
+            if len(self._entries) >= self.maxsize:
+                self._entries = {k: e for k, e in self._entries.items() if e[0] > now}
+                if len(self._entries) >= self.maxsize:
+                    del self._entries[next(iter(self._entries))]
+            self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+holiday_cache = TTLCache(ttl=24 * 3600)
+weather_cache = TTLCache(ttl=WEATHER_RUN_HOURS * 3600)
+
+
+def fetch_json(url):
+    response = http.get(url, timeout=UPSTREAM_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def public_holidays(year):
+    """
+    :return: list of the Australian public holidays of year from date.nager.at
+    """
+    return holiday_cache.get(year, lambda: fetch_json(f"{HOLIDAY_API}/api/v2/publicholidays/{year}/AU"))
+
+
+def forecast_run():
+    """
+    :return: start of the current forecast run in UTC
+    """
+    now = datetime.utcnow()
+    return now.replace(hour=now.hour - now.hour % WEATHER_RUN_HOURS, minute=0, second=0, microsecond=0)
+
+
+def forecast(lat, lng):
+    """
+    :return: the 7timer civil forecast for a location, cached per location and forecast run
+    """
+    url = f"{WEATHER_API}/bin/civil.php?lat={lat}&lng={lng}&ac=1&unit=metric&output=json&product=two"
+    return weather_cache.get((lat, lng, forecast_run()), lambda: fetch_json(url))
+
+
+class LRUCache:
+    """
+    Thread safe dict that keeps the maxsize most recently used entries.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+CITIES = {
+    "Sydney": [-33.865143, 151.209900],
+    "Melbourne": [-37.813628, 144.963058],
+    "Brisbane": [-27.470125, 153.021072],
+    "Adelaide": [-34.928181, 138.599931],
+    "Perth": [-31.952712, 115.860480],
+    "Hobart": [-42.880554, 147.324997],
+    "Darwin": [-12.462827, 130.841782],
+    "Canberra": [-35.282001, 149.128998]
+}
+# basemap tile URL template like "http://host/{z}/{x}/{y}.png", Stamen terrain when not set
+TILE_URL = os.environ.get('TILE_URL')
+TILE_CACHE_DIR = os.environ.get('TILE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tile_cache'))
+weather_maps = LRUCache(maxsize=32)
+# only the chart of the latest counts is kept, it is drawn again once they change
+statistics_charts = LRUCache(maxsize=1)
+# serialized GET responses by ETag, an ETag includes the store epoch and version so entries never go stale
+response_bodies = LRUCache(maxsize=1024)
+
+
+def not_modified(etag):
+    """
+    :return: an empty 304 response if the client already holds etag, otherwise None
+    """
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+
+def json_response(body, etag):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+@functools.lru_cache(maxsize=None)
+def basemaps():
+    """
+    :return: contextily, set up to keep downloaded tiles in TILE_CACHE_DIR so a map can be drawn again offline
+    """
+    # mapping libraries are slow to import, only load them once a map is drawn
+    import contextily as ctx
+    os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+    ctx.set_cache_dir(TILE_CACHE_DIR)
+    return ctx
+
+
+def city_forecast(city, date):
+    """
+    :return: the forecast series of city for date and the init time of its forecast run, or None
+    """
+    lat, lng = CITIES[city]
+    try:
+        response = forecast(lat, lng)
+    except requests.RequestException:
+        return None
+    init_time = datetime.strptime(response['init'], '%Y%m%d%H')
+    for series in response['dataseries']:
+        series_time = init_time + timedelta(hours=series['timepoint'])
+        if series_time.date() == date:
+            return series, response['init']
+    return None
+
+
+def render_weather_map(weather_data):
+    """
+    :param weather_data: dict of city to forecast series
+    :return: PNG of the cities on a basemap, coloured by weather
+    """
+    import geopandas as gpd
+    from matplotlib.figure import Figure
+    ctx = basemaps()
+
+    gdf = gpd.GeoDataFrame(list(weather_data.items()), columns=["City", "Weather"],
+                           geometry=gpd.points_from_xy([CITIES[city][1] for city in weather_data],
+                                                       [CITIES[city][0] for city in weather_data]))
+    gdf["Weather"] = gdf["Weather"].astype(str)
+    gdf = gdf.set_crs(epsg=4326).to_crs(epsg=3857)
+
+    # a Figure that is not registered with pyplot can be drawn from any thread and is freed afterwards
+    fig = Figure(figsize=(10, 10))
+    ax = fig.subplots()
+    gdf.plot(ax=ax, column="Weather", legend=True, markersize=100, cmap="coolwarm", categorical=True)
+    ctx.add_basemap(ax, source=TILE_URL or ctx.providers.Stamen.Terrain)
+    ax.set_axis_off()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
 
 
 @api.route('/events')
@@ -50,35 +934,22 @@ class EventsResource(Resource):
     @api.expect(event_fields, validate=True)
     def post(self):
         data = request.json
-        date = parse_date(data['date'])
-        start_time = parse_time(data['from'])
-        end_time = parse_time(data['to'])
-        location = data['location']
-        description = data.get('description', '')
-
-        for idx, event in df.iterrows():
-            if event['date'] == date and is_overlapping(event['start_time'], event['end_time'], start_time, end_time):
-                return {"message": "Event time is overlapping with an existing event."}, 400
-
-        id = len(df) + 1
-        new_event = {
-            "id": id,
-            "name": data['name'],
-            "date": date,
-            "start_time": start_time,
-            "end_time": end_time,
-            "location": json.dumps(location),
-            "description": description,
-            "last_update": datetime.now()
-        }
-        df.loc[id] = new_event
+        try:
+            date = parse_date(data['date'])
+            start_time = parse_time(data['from'])
+            end_time = parse_time(data['to'])
+            location = data['location']
+            description = data.get('description', '')
+            event = store.create(data['name'], date, start_time, end_time, json.dumps(location), description)
+        except (EventConflict, ValueError) as e:
+            return {"message": str(e)}, 400
 
         return {
-            "id": new_event['id'],
-            "last-update": new_event['last_update'].strftime("%Y-%m-%d %H:%M:%S"),
+            "id": event.id,
+            "last-update": event.value('last_update'),
             "_links": {
                 "self": {
-                    "href": f"/events/{new_event['id']}"
+                    "href": f"/events/{event.id}"
                 }
             }
         }, 201
@@ -89,27 +960,70 @@ class EventsResource(Resource):
     @api.param('size', 'The number of events per page for pagination. Default is 10.')
     @api.param('filter',
                'A comma-separated string value to filter the attributes to be shown for each event. Default is "id,name".')
+    @api.param('cursor', 'Instead of page, continue after the "next-cursor" of the previous response. '
+                         'Pass it empty for the first page.')
     def get(self):
+        # a page only depends on the query and the stored events
+        query = hashlib.sha1(request.query_string).hexdigest()[:16]
+        etag = f"events-{store.epoch}-{store.version}-{query}"
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        body = response_bodies.get(etag)
+        if body is None:
+            response, status = self.list_events()
+            if status != 200:
+                return response, status
+            body = json.dumps(response)
+            response_bodies.put(etag, body)
+        return json_response(body, etag)
+
+    @staticmethod
+    def list_events():
         order = request.args.get('order', '+id')
-        page = int(request.args.get('page', 1))
-        size = int(request.args.get('size', 10))
+        try:
+            page = int(request.args.get('page', 1))
+            size = int(request.args.get('size', 10))
+            if page < 1 or size < 1:
+                raise ValueError
+        except ValueError:
+            return {"message": "'page' and 'size' must be positive integers."}, 400
         filter_str = request.args.get('filter', 'id,name')
-        filter_attrs = filter_str.split(',')
+        filter_attrs = [attr for attr in filter_str.split(',') if attr in Event.__slots__]
+        cursor = request.args.get('cursor')
 
         sorting_keys = order.split(',')
-        df_sorted = df.sort_values(
-            by=[key[1:] for key in sorting_keys],
-            ascending=[key.startswith('+') for key in sorting_keys]
-        )
+        if any(key[1:] not in Event.__slots__ for key in sorting_keys):
+            return {"message": f"Invalid order '{order}'."}, 400
+        sorting = [(key[1:], key.startswith('-')) for key in sorting_keys]
+        if cursor is not None:
+            try:
+                after = decode_cursor(cursor, sorting)
+            except ValueError as e:
+                return {"message": str(e)}, 400
+            events_page, more = store.page_after(sorting, after, size)
+        else:
+            events_page, more = store.sorted_page(sorting, (page - 1) * size, size)
 
-        start_idx = (page - 1) * size
-        end_idx = page * size
-        df_paginated = df_sorted.iloc[start_idx:end_idx]
+        events = [{attr: event.value(attr) for attr in filter_attrs} for event in events_page]
 
-        events = []
-        for _, event in df_paginated.iterrows():
-            filtered_event = {attr: event[attr] for attr in filter_attrs if attr in event}
-            events.append(filtered_event)
+        if cursor is not None:
+            response = {
+                "page-size": size,
+                "events": events,
+                "_links": {
+                    "self": {
+                        "href": f"/events?order={order}&size={size}&filter={filter_str}&cursor={cursor}"
+                    }
+                }
+            }
+            if more:
+                next_cursor = encode_cursor(events_page[-1], sorting)
+                response["next-cursor"] = next_cursor
+                response["_links"]["next"] = {
+                    "href": f"/events?order={order}&size={size}&filter={filter_str}&cursor={next_cursor}"
+                }
+            return response, 200
 
         response = {
             "page": page,
@@ -122,7 +1036,7 @@ class EventsResource(Resource):
             }
         }
 
-        if end_idx < len(df_sorted):
+        if more:
             response["_links"]["next"] = {
                 "href": f"/events?order={order}&page={page + 1}&size={size}&filter={filter_str}"
             }
@@ -130,55 +1044,185 @@ class EventsResource(Resource):
         return response, 200
 
 
+# errors listed in the answer to a rejected batch, the message still gives the total
+MAX_BATCH_ERRORS = 100
+
+
+@api.route('/events/bulk')
+class EventsBulkResource(Resource):
+    # items are checked one by one below, schema validation of a large batch would take longer than storing it
+    @api.expect(api.model('EventBatch', {'events': fields.List(fields.Nested(event_fields), required=True)}))
+    def post(self):
+        payload = request.json
+        batch = payload.get('events') if isinstance(payload, dict) else None
+        if not isinstance(batch, list):
+            return {"message": "Expected an object with a list of 'events'."}, 400
+
+        items = []
+        errors = []
+        failed = 0
+
+        def fail(error):
+            # a broken batch of any size gets an answer of bounded size
+            nonlocal failed
+            failed += 1
+            if len(errors) < MAX_BATCH_ERRORS:
+                errors.append(error)
+
+        for position, data in enumerate(batch):
+            try:
+                if not isinstance(data, dict):
+                    raise TypeError("Each event must be an object.")
+                start_time = parse_time(data['from'])
+                end_time = parse_time(data['to'])
+                check_slot(start_time, end_time)
+                name, location, description = data['name'], data['location'], data.get('description', '')
+                # what validate=True checks for a single event, the indexes cannot order mixed types
+                if not isinstance(name, str):
+                    raise TypeError("'name' must be a string.")
+                if not isinstance(description, str):
+                    raise TypeError("'description' must be a string.")
+                if not isinstance(location, dict):
+                    raise TypeError("'location' must be an object.")
+                items.append((name, parse_date(data['date']), start_time, end_time, json.dumps(location), description))
+            except KeyError as e:
+                fail({"index": position, "message": f"Missing required field '{e.args[0]}'."})
+            except (ValueError, TypeError) as e:
+                fail({"index": position, "message": str(e)})
+
+        if not failed:
+            try:
+                events = store.create_many(items)
+            except BatchConflict as e:
+                for position in sorted(e.conflicts):
+                    fail({"index": position, "message": "Event time is overlapping with other events.",
+                          "conflict": e.conflicts[position]})
+        if failed:
+            message = f"No events were created, {failed} events have errors."
+            if failed > len(errors):
+                message += f" The first {len(errors)} are listed."
+            return {"message": message, "errors": errors}, 400
+
+        return {
+                   "created": len(events),
+                   "events": [{
+                       "id": event.id,
+                       "last-update": event.value('last_update'),
+                       "_links": {
+                           "self": {
+                               "href": f"/events/{event.id}"
+                           }
+                       }
+                   } for event in events]
+               }, 201
+
+
+@api.route('/events/conflicts')
+class EventConflictsResource(Resource):
+    @api.param('date', 'The date of the proposed slot. Format: "dd-mm-yyyy".')
+    @api.param('from', 'The start of the proposed slot. Format: "hh:mm:ss".')
+    @api.param('to', 'The end of the proposed slot. Format: "hh:mm:ss".')
+    def get(self):
+        try:
+            date = parse_date(request.args['date'])
+            start_time = parse_time(request.args['from'])
+            end_time = parse_time(request.args['to'])
+            check_slot(start_time, end_time)
+        except KeyError as e:
+            return {"message": f"Missing required parameter '{e.args[0]}'."}, 400
+        except ValueError as e:
+            return {"message": str(e)}, 400
+
+        conflicts = store.overlapping(date, start_time, end_time)
+        return {
+                   "date": date.strftime("%d-%m-%Y"),
+                   "from": start_time.strftime("%H:%M:%S"),
+                   "to": end_time.strftime("%H:%M:%S"),
+                   "available": not conflicts,
+                   "conflicts": [{
+                       "id": event.id,
+                       "name": event.name,
+                       "from": event.value('start_time'),
+                       "to": event.value('end_time'),
+                       "_links": {
+                           "self": {
+                               "href": f"/events/{event.id}"
+                           }
+                       }
+                   } for event in conflicts]
+               }, 200
+
+
 @api.route('/events/<int:event_id>')
 class EventResource(Resource):
     def get(self, event_id):
-        event = df.loc[event_id]
-        if event.empty:
+        # read before the event, so a concurrent write can only make the body newer than its version
+        epoch, version = store.epoch, store.version
+        event = store.get(event_id)
+        if event is None:
             return {"message": f"Event with ID {event_id} not found."}, 404
 
-        date = event['date']
+        # the links depend on other events and the metadata on the forecast, hence version and forecast run
+        etag = f"event-{epoch}-{event_id}-{event.last_update.timestamp():.6f}-{version}-{forecast_run():%Y%m%d%H}"
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        body = response_bodies.get(etag)
+        if body is not None:
+            return json_response(body, etag)
+
+        response = self.describe(event)
+        if 'weather' not in response['_metadata'] or 'holiday' not in response['_metadata']:
+            # an upstream failed, the next request should try again rather than get this from a cache
+            return response, 200
+        body = json.dumps(response)
+        response_bodies.put(etag, body)
+        return json_response(body, etag)
+
+    @staticmethod
+    def describe(event):
+        """
+        :return: the full representation of event, with metadata and links to its neighbours
+        """
+        event_id = event.id
+        date = event.date
         lat = -33.865143  # latitude of Sydney, Australia
         lng = 151.209900  # longitude of Sydney, Australia
-        holiday_api = f"https://date.nager.at/api/v2/publicholidays/{date.year}/AU"
-        weather_api = f"https://www.7timer.info/bin/civil.php?lat={lat}&lng={lng}&ac=1&unit=metric&output=json&product=two"
-        holiday_data = requests.get(holiday_api).json()
-        weather_data = requests.get(weather_api).json()
+        # both lookups run at the same time, an upstream that fails only leaves out its fields
+        holiday_future = fetch_pool.submit(public_holidays, date.year)
+        weather_future = fetch_pool.submit(forecast, lat, lng)
 
         metadata = {}
-        holiday = ""
-        for holiday_entry in holiday_data:
-            if holiday_entry['date'] == date.strftime('%Y-%m-%d'):
-                holiday = holiday_entry['name']
-                break
-        metadata['wind-speed'] = f"{weather_data['dataseries'][0]['wind10m']['speed']} KM"
-        metadata['weather'] = f"{weather_data['dataseries'][0]['weather']}"
-        metadata['humidity'] = f"{weather_data['dataseries'][0]['rh2m']}"
-        metadata['temperature'] = f"{weather_data['dataseries'][0]['temp2m']} C"
-        metadata['holiday'] = holiday
+        try:
+            weather_data = weather_future.result()
+            metadata['wind-speed'] = f"{weather_data['dataseries'][0]['wind10m']['speed']} KM"
+            metadata['weather'] = f"{weather_data['dataseries'][0]['weather']}"
+            metadata['humidity'] = f"{weather_data['dataseries'][0]['rh2m']}"
+            metadata['temperature'] = f"{weather_data['dataseries'][0]['temp2m']} C"
+        except requests.RequestException:
+            pass
+        try:
+            holiday = ""
+            for holiday_entry in holiday_future.result():
+                if holiday_entry['date'] == date.strftime('%Y-%m-%d'):
+                    holiday = holiday_entry['name']
+                    break
+            metadata['holiday'] = holiday
+        except requests.RequestException:
+            pass
         metadata['weekend'] = date.weekday() >= 5
 
-        previous_event = None
-        next_event = None
-        for idx, event_row in df.iterrows():
-            if idx == event_id:
-                continue
-            if event_row['date'] < date:
-                if previous_event is None or previous_event['date'] < event_row['date']:
-                    previous_event = event_row
-            else:
-                if next_event is None or next_event['date'] > event_row['date']:
-                    next_event = event_row
+        previous_event, next_event = store.neighbours(event)
 
         response = {
             "id": event_id,
-            "last-update": event['last_update'].strftime("%Y-%m-%d %H:%M:%S"),
-            "name": event['name'],
-            "date": date.strftime("%d-%m-%Y"),
-            "from": event['start_time'].strftime("%H:%M"),
-            "to": event['end_time'].strftime("%H:%M"),
-            "location": json.loads(event['location']),
-            "description": event['description'],
+            "last-update": event.value('last_update'),
+            "name": event.name,
+            "date": event.value('date'),
+            "from": event.start_time.strftime("%H:%M"),
+            "to": event.end_time.strftime("%H:%M"),
+            "location": event.value('location'),
+            "description": event.description,
             "_metadata": metadata,
             "_links": {
                 "self": {
@@ -187,17 +1231,16 @@ class EventResource(Resource):
             }
         }
         if previous_event is not None:
-            response["_links"]["previous"] = {"href": f"/events/{previous_event.name}"}
+            response["_links"]["previous"] = {"href": f"/events/{previous_event.id}"}
         if next_event is not None:
-            response["_links"]["next"] = {"href": f"/events/{next_event.name}"}
+            response["_links"]["next"] = {"href": f"/events/{next_event.id}"}
 
-        return response, 200
+        return response
 
     def delete(self, event_id):
-        if event_id not in df.index:
+        if store.delete(event_id) is None:
             return {"message": f"Event with ID {event_id} not found."}, 404
 
-        df.drop(event_id, inplace=True)
         return {
                    "message": f"The event with id {event_id} was removed from the database!",
                    "id": event_id
@@ -205,28 +1248,29 @@ class EventResource(Resource):
 
     @api.expect(event_fields, validate=True)
     def patch(self, event_id):
-        event = df.loc[event_id]
-        if event.empty:
-            return {"message": f"Event with ID {event_id} not found."}, 404
-
         data = request.json
-        for key, value in data.items():
-            if key == 'date':
-                event['date'] = parse_date(value)
-            elif key == 'from':
-                event['start_time'] = parse_time(value)
-            elif key == 'to':
-                event['end_time'] = parse_time(value)
-            elif key == 'location':
-                event['location'] = json.dumps(value)
-            elif key in ['name', 'description', 'last_update']:
-                event[key] = value
-
-        df.loc[event_id] = event
+        changes = {}
+        try:
+            for key, value in data.items():
+                if key == 'date':
+                    changes['date'] = parse_date(value)
+                elif key == 'from':
+                    changes['start_time'] = parse_time(value)
+                elif key == 'to':
+                    changes['end_time'] = parse_time(value)
+                elif key == 'location':
+                    changes['location'] = json.dumps(value)
+                elif key in ['name', 'description']:
+                    changes[key] = value
+            event = store.update(event_id, **changes)
+        except (EventConflict, ValueError) as e:
+            return {"message": str(e)}, 400
+        if event is None:
+            return {"message": f"Event with ID {event_id} not found."}, 404
 
         return {
             "id": event_id,
-            "last-update": event['last_update'].strftime("%Y-%m-%d %H:%M:%S"),
+            "last-update": event.value('last_update'),
             "_links": {
                 "self": {
                     "href": f"/events/{event_id}"
@@ -248,45 +1292,21 @@ class WeatherResource(Resource):
         except ValueError:
             return {"message": "Invalid date format. Must be 'dd-mm-yyyy'."}, 400
 
-        cities = {
-            "Sydney": [-33.865143, 151.209900],
-            "Melbourne": [-37.813628, 144.963058],
-            "Brisbane": [-27.470125, 153.021072],
-            "Adelaide": [-34.928181, 138.599931],
-            "Perth": [-31.952712, 115.860480],
-            "Hobart": [-42.880554, 147.324997],
-            "Darwin": [-12.462827, 130.841782],
-            "Canberra": [-35.282001, 149.128998]
-        }
-
+        forecasts = fetch_pool.map(city_forecast, CITIES, [date] * len(CITIES))
         weather_data = {}
-        for city, coords in cities.items():
-            lat, lng = coords
-            weather_api = f"https://www.7timer.info/bin/civil.php?lat={lat}&lng={lng}&ac=1&unit=metric&output=json&product=two"
-            response = requests.get(weather_api).json()
-            init_time = datetime.strptime(response['init'], '%Y%m%d%H')
-            for series in response['dataseries']:
-                series_time = init_time + timedelta(hours=series['timepoint'])
-                if series_time.date() == date:
-                    weather_data[city] = series
-                    break
+        runs = set()
+        for city, found in zip(CITIES, forecasts):
+            if found is not None:
+                weather_data[city], init = found
+                runs.add(init)
 
         if weather_data:
-            gdf = gpd.GeoDataFrame(list(weather_data.items()), columns=["City", "Weather"],
-                                   geometry=gpd.points_from_xy([coords[1] for coords in cities.values()],
-                                                               [coords[0] for coords in cities.values()]))
-            gdf["Weather"] = gdf["Weather"].astype(str)
-            gdf = gdf.set_crs(epsg=4326).to_crs(epsg=3857)
-
-            fig, ax = plt.subplots(figsize=(10, 10))
-            gdf.plot(ax=ax, column="Weather", legend=True, markersize=100, cmap="coolwarm", categorical=True)
-            ctx.add_basemap(ax, source=ctx.providers.Stamen.Terrain)
-            ax.set_axis_off()
-
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png')
-            buf.seek(0)
-            return send_file(buf, mimetype='image/png')
+            key = (date, tuple(sorted(runs)), tuple(weather_data))
+            png = weather_maps.get(key)
+            if png is None:
+                png = render_weather_map(weather_data)
+                weather_maps.put(key, png)
+            return send_file(io.BytesIO(png), mimetype='image/png')
         else:
             return {"message": "No weather data available for the requested date."}, 404
 
@@ -305,11 +1325,10 @@ class EventStatisticsResource(Resource):
         month_start = today.replace(day=1)
         month_end = (today.replace(month=today.month % 12 + 1, day=1) - timedelta(days=1))
 
-        total = len(df)
-        total_current_week = len(df[(df['date'] >= week_start) & (df['date'] <= week_end)])
-        total_current_month = len(df[(df['date'] >= month_start) & (df['date'] <= month_end)])
-        #per_days = df.groupby('date').size().to_dict()
-        per_days = {date.strftime('%Y-%m-%d'): count for date, count in df.groupby('date').size().items()}
+        total = len(store)
+        total_current_week = store.count_between(week_start, week_end)
+        total_current_month = store.count_between(month_start, month_end)
+        per_days = {date.strftime('%Y-%m-%d'): count for date, count in sorted(store.day_counts().items())}
 
         if output_format == 'json':
             return {
@@ -319,18 +1338,25 @@ class EventStatisticsResource(Resource):
                        "per-days": per_days
                    }, 200
         elif output_format == 'image':
-            fig, ax = plt.subplots()
-            dates = list(per_days.keys())
-            events_count = list(per_days.values())
-            ax.bar(dates, events_count)
-            ax.set_xlabel('Dates')
-            ax.set_ylabel('Number of Events')
-            ax.set_title('Number of Events per Day')
-
-            buf = io.BytesIO()
-            fig.savefig(buf, format='png')
-            buf.seek(0)
-            return send_file(buf, mimetype='image/png')
+            key = tuple(per_days.items())
+            png = statistics_charts.get(key)
+            if png is None:
+                from matplotlib.figure import Figure
+
+                fig = Figure()
+                ax = fig.subplots()
+                dates = list(per_days.keys())
+                events_count = list(per_days.values())
+                ax.bar(dates, events_count)
+                ax.set_xlabel('Dates')
+                ax.set_ylabel('Number of Events')
+                ax.set_title('Number of Events per Day')
+
+                buf = io.BytesIO()
+                fig.savefig(buf, format='png')
+                png = buf.getvalue()
+                statistics_charts.put(key, png)
+            return send_file(io.BytesIO(png), mimetype='image/png')
 
 
 if __name__ == '__main__':
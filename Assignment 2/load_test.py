@@ -0,0 +1,251 @@
+"""
+Load test for the a2.py events API. For each store size the store is filled with that many
+events, then worker threads send a weighted mix of requests and the latency of every request is
+recorded. The holiday, weather and tile APIs are served by stub_server.py inside this process, so
+no network access is needed. Throughput and p50/p95/p99 latency per endpoint and store size are
+printed and written as JSON.
+
+    python load_test.py --sizes 1000 10000 100000 --requests 2000 --concurrency 8 --output load.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from werkzeug.serving import make_server
+
+import stub_server
+
+MIX = {'post': 15, 'list': 25, 'list-cursor': 10, 'detail': 25, 'patch': 10, 'delete': 5, 'statistics': 7,
+       'weather': 3}
+LOCATION = {"street": "215B Night Ave", "suburb": "Kensington", "state": "NSW", "post-code": "2033"}
+EVENTS_PER_DAY = 12
+
+
+def start(app):
+    """
+    Serve app on a free local port from a daemon thread.
+    :return: base URL of the server
+    """
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def slot(n, first_day):
+    """
+    :return: date and times of the n-th hourly slot from first_day, every slot is free
+    """
+    day = first_day + timedelta(days=n // EVENTS_PER_DAY)
+    hour = 8 + n % EVENTS_PER_DAY
+    return day.strftime("%d-%m-%Y"), f"{hour:02d}:00:00", f"{hour:02d}:45:00"
+
+
+def fill(a2, size):
+    """
+    Replace the store of a2 by one holding size events spread over the days from today on.
+    """
+    if os.environ.get('EVENTS_DB'):
+        path = os.path.join(tempfile.mkdtemp(), 'events.db')
+        a2.store = a2.SQLiteEventStore(path)
+    else:
+        a2.store = a2.EventStore()
+    today = date.today()
+    for first in range(0, size, 10_000):
+        items = []
+        for n in range(first, min(size, first + 10_000)):
+            day, start_time, end_time = slot(n, today)
+            items.append((f"Event {n}", a2.parse_date(day), a2.parse_time(start_time), a2.parse_time(end_time),
+                          json.dumps(LOCATION), "Generated by load_test.py"))
+        a2.store.create_many(items)
+
+
+class Workload:
+    """
+    Picks requests by weight. New events go into a range of days after the filled ones, so they do
+    not conflict with each other; ids for reads and writes are drawn from everything created so far.
+    """
+    def __init__(self, size, mix, seed):
+        self.size = size
+        self.mix = mix
+        self.seed = seed
+        self.next_slot = itertools.count()
+        self.first_free_day = date.today() + timedelta(days=size // EVENTS_PER_DAY + 1)
+        self.highest_id = size
+
+    def request(self, rnd):
+        """
+        :return: endpoint name, method, path and JSON body of the next request
+        """
+        name = rnd.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        event_id = rnd.randint(1, max(1, self.highest_id))
+        if name == 'post':
+            day, start_time, end_time = slot(next(self.next_slot), self.first_free_day)
+            return name, 'POST', '/events', {"name": "Load test", "date": day, "from": start_time, "to": end_time,
+                                             "location": LOCATION, "description": ""}
+        if name == 'list':
+            order = rnd.choice(['+id', '-date', '+name', '-last_update'])
+            pages = max(1, self.size // 10)
+            return name, 'GET', f"/events?order={order.replace('+', '%2B')}&page={rnd.randint(1, pages)}&size=10" \
+                                f"&filter=id,name,date", None
+        if name == 'list-cursor':
+            return name, 'GET', "/events?order=-date&size=10&filter=id,name,date&cursor=", None
+        if name == 'detail':
+            return name, 'GET', f"/events/{event_id}", None
+        if name == 'patch':
+            return name, 'PATCH', f"/events/{event_id}", {"description": f"Changed {rnd.random():.6f}"}
+        if name == 'delete':
+            return name, 'DELETE', f"/events/{event_id}", None
+        if name == 'statistics':
+            return name, 'GET', f"/events/statistics?format={rnd.choice(['json', 'image'])}", None
+        day = date.today() + timedelta(days=rnd.randint(0, 2))
+        return name, 'GET', f"/weather?date={day.strftime('%d-%m-%Y')}", None
+
+
+def send(client, http, base, method, path, body):
+    """
+    :return: status code of the request, and the id of the event it created or None
+    """
+    if http is not None:
+        response = http.request(method, base + path, json=body, timeout=60)
+        status = response.status_code
+        created = response.json()['id'] if method == 'POST' and status == 201 else None
+    else:
+        response = client.open(path, method=method, json=body)
+        status = response.status_code
+        created = response.json['id'] if method == 'POST' and status == 201 else None
+    return status, created
+
+
+def run(a2, workload, requests_total, concurrency, base=None):
+    """
+    :return: list of (endpoint, status, seconds) and the wall time of the whole run
+    """
+    counter = itertools.count()
+    records = []
+    lock = threading.Lock()
+
+    def worker(number):
+        rnd = random.Random(workload.seed * 1000 + number)
+        client = a2.app.test_client()
+        http = None
+        if base is not None:
+            import requests
+            http = requests.Session()
+        own = []
+        while next(counter) < requests_total:
+            name, method, path, body = workload.request(rnd)
+            began = time.perf_counter()
+            status, created = send(client, http, base, method, path, body)
+            own.append((name, status, time.perf_counter() - began))
+            if created:
+                with lock:
+                    workload.highest_id = max(workload.highest_id, created)
+        with lock:
+            records.extend(own)
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    return records, time.perf_counter() - began
+
+
+def percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def summarise(records, seconds):
+    """
+    :return: dict of endpoint to request count, status counts, throughput and latency percentiles in ms
+    """
+    summary = {}
+    by_endpoint = {}
+    for name, status, latency in records:
+        by_endpoint.setdefault(name, []).append((status, latency))
+    by_endpoint['all'] = [(status, latency) for _, status, latency in records]
+    for name, results in sorted(by_endpoint.items()):
+        latencies = sorted(latency for _, latency in results)
+        statuses = {}
+        for status, _ in results:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary[name] = {
+            'requests': len(results),
+            'statuses': statuses,
+            'throughput': len(results) / seconds,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+        }
+    return summary
+
+
+def parse_mix(text):
+    mix = dict(MIX)
+    for part in filter(None, text.split(',')):
+        name, weight = part.split('=')
+        if name not in MIX:
+            raise argparse.ArgumentTypeError(f"unknown endpoint {name}, expected one of {', '.join(MIX)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000], help='events in the store')
+    parser.add_argument('--requests', type=int, default=2_000, help='requests per store size')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads sending requests')
+    parser.add_argument('--mix', type=parse_mix, default=dict(MIX),
+                        help='endpoint weights to change, e.g. "post=50,weather=0"; endpoints: ' + ', '.join(MIX))
+    parser.add_argument('--stub-latency', type=float, default=0.05, help='seconds the stub APIs wait per request')
+    parser.add_argument('--http', action='store_true',
+                        help='serve the app on a local threaded server and send real HTTP requests, '
+                             'instead of calling it through the Flask test client')
+    parser.add_argument('--sqlite', action='store_true', help='use the SQLite store, in a temporary file')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_test.json')
+    args = parser.parse_args()
+
+    # one log line per request would drown the report
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    stub_server.latency = args.stub_latency
+    stub = start(stub_server.app)
+    # a2 reads these when it is imported
+    os.environ['HOLIDAY_API'] = stub
+    os.environ['WEATHER_API'] = stub
+    os.environ['TILE_URL'] = stub + '/tiles/{z}/{x}/{y}.png'
+    os.environ['TILE_CACHE_DIR'] = tempfile.mkdtemp()
+    if args.sqlite:
+        os.environ['EVENTS_DB'] = os.path.join(tempfile.mkdtemp(), 'events.db')
+    import a2
+
+    base = start(a2.app) if args.http else None
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'store': 'sqlite' if args.sqlite else 'memory',
+        'transport': 'http' if args.http else 'test-client',
+        'concurrency': args.concurrency,
+        'mix': args.mix,
+        'stub_latency': args.stub_latency,
+        'results': [],
+    }
+    for size in args.sizes:
+        fill(a2, size)
+        records, seconds = run(a2, Workload(size, args.mix, args.seed), args.requests, args.concurrency, base)
+        summary = summarise(records, seconds)
+        report['results'].append({'size': size, 'seconds': seconds, 'endpoints': summary})
+        print(f"{size} events, {len(records)} requests in {seconds:.2f}s")
+        for name, row in summary.items():
+            print("    {:<12} {:6d} req {:8.1f}/s  p50 {:8.2f}  p95 {:8.2f}  p99 {:8.2f} ms  {}".format(
+                name, row['requests'], row['throughput'], row['p50_ms'], row['p95_ms'], row['p99_ms'],
+                ' '.join(f"{status}:{count}" for status, count in sorted(row['statuses'].items()))))
+    report['caches'] = {'holidays': a2.holiday_cache.stats(), 'weather': a2.weather_cache.stats()}
+    report['stub_requests'] = dict(stub_server.served)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
@@ -0,0 +1,98 @@
+"""
+Local stand-in for the date.nager.at, 7timer and map tile APIs that a2.py calls, with a fixed
+delay per request, so enrichment latency and cache hit rates can be measured without network
+access. GET /stats returns the number of requests served per API.
+
+    python stub_server.py --port 5001 --latency 0.3
+    HOLIDAY_API=http://127.0.0.1:5001 WEATHER_API=http://127.0.0.1:5001 \
+        TILE_URL="http://127.0.0.1:5001/tiles/{z}/{x}/{y}.png" python a2.py
+"""
+import argparse
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime
+
+from flask import Flask, request
+
+app = Flask(__name__)
+latency = 0.0
+served = Counter()
+served_lock = threading.Lock()
+
+WEATHER = ['clearday', 'pcloudyday', 'mcloudyday', 'cloudyday', 'humidday', 'lightrainday', 'rainday', 'tsday']
+
+
+def serve(api):
+    with served_lock:
+        served[api] += 1
+    time.sleep(latency)
+
+
+@app.route('/api/v2/publicholidays/<int:year>/AU')
+def public_holidays(year):
+    serve('holidays')
+    return [
+        {"date": date(year, 1, 1).isoformat(), "name": "New Year's Day"},
+        {"date": date(year, 1, 26).isoformat(), "name": "Australia Day"},
+        {"date": date(year, 4, 25).isoformat(), "name": "Anzac Day"},
+        {"date": date(year, 12, 25).isoformat(), "name": "Christmas Day"},
+        {"date": date(year, 12, 26).isoformat(), "name": "Boxing Day"},
+    ]
+
+
+@app.route('/bin/civil.php')
+def civil():
+    serve('weather')
+    now = datetime.utcnow()
+    init = now.replace(hour=now.hour - now.hour % 6)
+    # values only depend on the location and the time point, so repeated calls agree
+    seed = int(abs(float(request.args.get('lat', 0)) * 100 + float(request.args.get('lng', 0)) * 10))
+    return {
+        "product": "civil",
+        "init": init.strftime('%Y%m%d%H'),
+        "dataseries": [{
+            "timepoint": timepoint,
+            "weather": WEATHER[(seed + timepoint) % len(WEATHER)],
+            "temp2m": 10 + (seed + timepoint) % 20,
+            "rh2m": f"{40 + (seed + timepoint) % 50}%",
+            "wind10m": {"direction": "N", "speed": 1 + (seed + timepoint) % 6},
+        } for timepoint in range(3, 195, 3)]
+    }
+
+
+def solid_png(rgb, size=256):
+    """
+    :return: PNG of a single colour, written by hand to not need an imaging library
+    """
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+    rows = b''.join(b'\x00' + bytes(rgb) * size for _ in range(size))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+TILES = [solid_png((206, 222, 196)), solid_png((184, 206, 226))]
+
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.png')
+def tile(z, x, y):
+    serve('tiles')
+    return TILES[(x + y) % 2], 200, {'Content-Type': 'image/png'}
+
+
+@app.route('/stats')
+def stats():
+    with served_lock:
+        return dict(served)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds to wait before each response')
+    args = parser.parse_args()
+    latency = args.latency
+    app.run(port=args.port, threaded=True)
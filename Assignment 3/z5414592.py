@@ -1,93 +1,129 @@
+import argparse
+import os
+import joblib
 import pandas as pd
 import numpy as np
-import sys
-import seaborn as sns
-from sklearn.model_selection import train_test_split
+import sklearn
+from sklearn.compose import ColumnTransformer
 from sklearn.linear_model import LinearRegression, LogisticRegression
-from sklearn.metrics import mean_squared_error, accuracy_score, r2_score
-from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OrdinalEncoder, StandardScaler
 from sklearn.impute import SimpleImputer
 
+# bump when the features or models change, so saved models are trained again
+MODEL_VERSION = 1
+MODEL_FILE = "z5414592.model.joblib"
+NUMERIC_COLUMNS = ["Number_of_Shops_Around_ATM", "No_of_Other_ATMs_in_1_KM_radius",
+                   "Estimated_Number_of_Houses_in_1_KM_Radius", "Average_Wait_Time"]
+DAY_TYPES = ["Working", "Festival"]
+# the columns the models read, numbers as float so that a chunk with a missing value has the same dtypes
+SCORING_DTYPES = {**{column: "float64" for column in NUMERIC_COLUMNS},
+                  "Day_Type": "object", "rating": "float64", "revenue": "float64"}
+
 
 def read_tsv(file):
     return pd.read_csv(file, delimiter='\t')
 
 
-def preprocess(df):
-    columns_to_drop = ["ATM_Zone", "ATM_Location_TYPE", "ATM_looks", "ATM_Attached_to", "ATM_Placement", "ATM_TYPE"]
-    df = df.drop(columns_to_drop, axis=1)
-    df["Day_Type"] = df["Day_Type"].map({"Working": 0, "Festival": 1})
-
-    numeric_columns = df.select_dtypes(include=[np.number]).columns
-    categorical_columns = df.select_dtypes(exclude=[np.number]).columns
-
-    for column in numeric_columns:
-        imputer_mean = SimpleImputer(strategy='mean')
-        df[column] = imputer_mean.fit_transform(df[[column]])
-
-    for column in categorical_columns:
-        imputer_mode = SimpleImputer(strategy='most_frequent')
-        df[column] = imputer_mode.fit_transform(df[[column]])
+def read_batches(file, chunksize):
+    """
+    :return: iterator over the scoring columns of file in frames of chunksize rows
+    """
+    return pd.read_csv(file, delimiter='\t', usecols=list(SCORING_DTYPES), dtype=SCORING_DTYPES, chunksize=chunksize)
 
-    return df
 
+def preprocess(target):
+    """
+    Pipeline steps that turn a raw ATM frame into the features for target: the ATM_* description
+    columns and target are dropped, Day_Type becomes Working 0 and Festival 1 (any other value
+    counts as missing) and missing values are filled with the means seen in training.
+    :param target: "revenue" or "rating", the other one is used as a feature
+    """
+    other = "rating" if target == "revenue" else "revenue"
+    columns = ColumnTransformer([
+        ("numeric", "passthrough", NUMERIC_COLUMNS),
+        ("day_type", OrdinalEncoder(categories=[DAY_TYPES], handle_unknown="use_encoded_value", unknown_value=np.nan),
+         ["Day_Type"]),
+        (other, "passthrough", [other]),
+    ])
+    return [("columns", columns), ("impute", SimpleImputer(strategy='mean'))]
 
-def predict_revenue(df_train, df_test):
-    X = df_train.drop("revenue", axis=1)
-    y = df_train["revenue"]
 
-    scaler = StandardScaler()
-    X = scaler.fit_transform(X)
+def fit_revenue(df_train):
+    df_train = df_train.dropna(subset=["revenue"])
+    model = Pipeline(preprocess("revenue") + [("scale", StandardScaler()), ("model", LinearRegression())])
+    return model.fit(df_train, df_train["revenue"])
 
-    model = LinearRegression()
-    model.fit(X, y)
 
-    X_test = df_test.drop("revenue", axis=1)
-    X_test = scaler.transform(X_test)
-    y_pred = model.predict(X_test)
+def fit_rating(df_train):
+    df_train = df_train.dropna(subset=["rating"])
+    model = Pipeline(preprocess("rating") + [("scale", StandardScaler()), ("model", LogisticRegression())])
+    return model.fit(df_train, df_train["rating"])
 
-    return y_pred
 
+def predict_revenue(model, df_test):
+    return model.predict(df_test)
 
-def predict_rating(df_train, df_test):
-    X = df_train.drop("rating", axis=1)
-    y = df_train["rating"]
 
-    scaler = StandardScaler()
-    X = scaler.fit_transform(X)
+def predict_rating(model, df_test):
+    return model.predict(df_test)
 
-    model = LogisticRegression()
-    model.fit(X, y)
 
-    X_test = df_test.drop("rating", axis=1)
-    X_test = scaler.transform(X_test)
-    y_pred = model.predict(X_test)
+def training_stamp(train_file):
+    """
+    :return: what a saved model has to match to be reused: code version, scikit-learn version and the training file
+    """
+    stat = os.stat(train_file)
+    return {"version": MODEL_VERSION, "sklearn": sklearn.__version__,
+            "train_file": os.path.abspath(train_file), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
 
-    return y_pred
-
-
-def main():
-    train_file = sys.argv[1]
-    test_file = sys.argv[2]
 
+def load_models(train_file, model_file=MODEL_FILE, retrain=False):
+    """
+    :return: dict with the fitted "revenue" and "rating" pipelines, read from model_file if it was saved
+            from the same training file by the same version, otherwise trained and saved there
+    """
+    stamp = training_stamp(train_file)
+    if not retrain and os.path.exists(model_file):
+        saved = joblib.load(model_file)
+        if saved.get("stamp") == stamp:
+            return saved
     df_train = read_tsv(train_file)
-    df_test = read_tsv(test_file)
+    models = {"stamp": stamp, "revenue": fit_revenue(df_train), "rating": fit_rating(df_train)}
+    # written under another name first, so a run that stops half way leaves no broken model behind
+    joblib.dump(models, model_file + ".tmp")
+    os.replace(model_file + ".tmp", model_file)
+    return models
 
-    df_train = preprocess(df_train)
-    df_test = preprocess(df_test)
 
-    predicted_revenue = predict_revenue(df_train, df_test)
-    predicted_rating = predict_rating(df_train, df_test)
+def write_predictions(f, values):
+    """
+    Write values truncated to integers, one per line, with a single write for the whole batch.
+    """
+    if len(values):
+        f.write("\n".join(np.asarray(values).astype(np.int64).astype(str)) + "\n")
 
-    with open("z5414592.PART1.output.csv", "w") as f:
-        f.write("predicted_revenue\n")
-        for value in predicted_revenue:
-            f.write(f"{int(value)}\n")
 
-    with open("z5414592.PART2.output.csv", "w") as f:
-        f.write("predicted_rating\n")
-        for value in predicted_rating:
-            f.write(f"{int(value)}\n")
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('train_file')
+    parser.add_argument('test_file')
+    parser.add_argument('--model', default=MODEL_FILE, help='where the fitted models are saved and loaded from')
+    parser.add_argument('--retrain', action='store_true', help='train again even if a saved model matches')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='score the test file this many rows at a time, so memory does not grow with its size')
+    args = parser.parse_args()
+
+    models = load_models(args.train_file, args.model, args.retrain)
+    batches = read_batches(args.test_file, args.chunksize) if args.chunksize else [read_tsv(args.test_file)]
+
+    with open("z5414592.PART1.output.csv", "w", buffering=1 << 20) as revenue_file, \
+            open("z5414592.PART2.output.csv", "w", buffering=1 << 20) as rating_file:
+        revenue_file.write("predicted_revenue\n")
+        rating_file.write("predicted_rating\n")
+        for df_test in batches:
+            write_predictions(revenue_file, predict_revenue(models["revenue"], df_test))
+            write_predictions(rating_file, predict_rating(models["rating"], df_test))
 
 
 if __name__ == "__main__":
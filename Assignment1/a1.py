@@ -1,38 +1,492 @@
+import argparse
+import functools
+import glob
+import hashlib
 import json
-import matplotlib.pyplot as plt
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import pandas as pd
 import sys
+import threading
+import time
 import os
+import pickle
 import numpy as np
 import math
 import re
 
 studentid = os.path.basename(sys.modules[__name__].__file__)
 
+# Explicit schemas so ports, countries and regions are read as categoricals and counts as
+# narrow integers instead of Python objects and int64.
+CITY_PAIRS_DTYPES = {
+    'Month': 'category',
+    'AustralianPort': 'category',
+    'ForeignPort': 'category',
+    'Country': 'category',
+    'Passengers_In': 'int32',
+    'Freight_In_(tonnes)': 'float64',
+    'Mail_In_(tonnes)': 'float64',
+    'Passengers_Out': 'int32',
+    'Freight_Out_(tonnes)': 'float64',
+    'Mail_Out_(tonnes)': 'float64',
+    'Year': 'int16',
+    'Month_num': 'int8',
+}
+SEATS_DTYPES = {
+    'Month': 'category',
+    'In_Out': 'category',
+    'Australian_City': 'category',
+    'International_City': 'category',
+    'Airline': 'category',
+    'Route': 'category',
+    'Port_Country': 'category',
+    'Port_Region': 'category',
+    'Service_Country': 'category',
+    'Service_Region': 'category',
+    'Stops': 'int8',
+    'All_Flights': 'int32',
+    'Max_Seats': 'int32',
+    'Year': 'int16',
+    'Month_num': 'int8',
+}
+CHUNKSIZE = 1_000_000
+
+
+log_lock = threading.Lock()
+# set by --production: log() prints only the header and shape, no preview of the frame
+preview = True
+# set by --metrics: file object that instrumented stages write JSON lines records to
+metrics_file = None
+
 
 def log(question, output_df, other):
-    print("--------------- {}----------------".format(question))
+    lines = ["--------------- {}----------------".format(question)]
 
     if other is not None:
-        print(question, other)
-    if output_df is not None:
-        df = output_df.head(5).copy(True)
-        for c in df.columns:
-            df[c] = df[c].apply(lambda a: a[:20] if isinstance(a, str) else a)
+        lines.append("{} {}".format(question, other))
+    if output_df is not None and preview:
+        head = output_df.head(5)
+        df = pd.DataFrame({i: truncate(head.iloc[:, i]) for i in range(head.shape[1])}, index=head.index)
+        df.columns = [a[:10] + "..." for a in head.columns]
+        lines.append(df.to_string())
+
+    # questions may run on several threads, keep each block together
+    with log_lock:
+        print("\n".join(lines))
+
+
+def note(message):
+    with log_lock:
+        print(message)
+
+
+def truncate(column):
+    if column.dtype != object and not isinstance(column.dtype, pd.CategoricalDtype):
+        return column
+    return column.astype(object).map(lambda a: a[:20] if isinstance(a, str) else a)
+
+
+def frame_stats(prefix, frames):
+    frames = [f for f in frames if isinstance(f, pd.DataFrame)]
+    if not frames:
+        return {}
+    return {
+        prefix + '_rows': sum(len(f) for f in frames),
+        prefix + '_memory_mb': sum(f.memory_usage(deep=True).sum() for f in frames) / 2 ** 20,
+    }
+
+
+def instrumented(func):
+    """
+    When metrics_file is set, write one JSON record per call of func with its wall time, CPU
+    time of the calling thread, growth of the process peak RSS, and the rows and memory usage of
+    the frames going in and out. Costs nothing when metrics are off.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if metrics_file is None:
+            return func(*args, **kwargs)
+        peak_before = peak_memory()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        result = func(*args, **kwargs)
+        record = {
+            'stage': func.__name__,
+            'timestamp': time.time(),
+            'wall_seconds': time.perf_counter() - wall,
+            'cpu_seconds': time.thread_time() - cpu,
+            'peak_rss_delta_mb': peak_memory() - peak_before if peak_before is not None else None,
+        }
+        record.update(frame_stats('in', args))
+        record.update(frame_stats('out', result if isinstance(result, tuple) else [result]))
+        with log_lock:
+            metrics_file.write(json.dumps(record) + "\n")
+            metrics_file.flush()
+        return result
+    return wrapper
+
+
+def read_typed(path, dtypes, usecols=None, chunksize=None):
+    """
+    Read a csv with an explicit schema.
+    :param usecols: only parse these columns, default is every column in the file
+    :param chunksize: if given, return an iterator of DataFrames of at most this many rows
+    """
+    if usecols is not None:
+        dtypes = {c: dtypes[c] for c in usecols if c in dtypes}
+    return pd.read_csv(path, usecols=usecols, dtype=dtypes, chunksize=chunksize)
+
+
+# Parsed frames are cached in memory for the run and as feather files next to the source csv.
+# Bump CACHE_VERSION whenever the parsing changes in a way the dtypes do not capture.
+CACHE_VERSION = 1
+frame_cache = {}
+cache_locks = {}
+
+
+def cache_path(path, dtypes):
+    """
+    :return: path of the feather file caching the parse of path with the given schema; it changes
+            whenever the file's size or mtime, the schema or CACHE_VERSION change
+    """
+    stat = os.stat(path)
+    key = json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns, CACHE_VERSION, dtypes])
+    return "{}.{}.feather".format(path, hashlib.sha1(key.encode()).hexdigest()[:16])
+
+
+def load_typed(path, dtypes):
+    """
+    Like read_typed, but each file is only parsed once: frames are reused from memory within
+    a run and from the feather cache across runs.
+    :return: a shallow copy of the cached frame, so callers may add columns but must not
+            modify existing ones in place
+    """
+    with cache_locks.setdefault(path, threading.Lock()):
+        return load_cached(path, dtypes)
+
+
+def load_cached(path, dtypes):
+    cached = cache_path(path, dtypes)
+    if cached in frame_cache:
+        note("cache hit (memory): {}".format(path))
+        return frame_cache[cached].copy(deep=False)
+
+    df = None
+    if os.path.exists(cached):
+        try:
+            df = pd.read_feather(cached)
+            note("cache hit (disk): {}".format(path))
+        except (ImportError, OSError) as e:
+            note("cache unreadable: {} ({})".format(cached, e))
+    if df is None:
+        note("cache miss: {}".format(path))
+        df = read_typed(path, dtypes)
+        clear_cache(path)
+        try:
+            df.to_feather(cached)
+        except (ImportError, OSError) as e:
+            note("cache not written: {} ({})".format(cached, e))
+
+    frame_cache[cached] = df
+    return df.copy(deep=False)
+
+
+def clear_cache(path):
+    """
+    Invalidate every cached parse of path, in memory and on disk.
+    """
+    for cached in [c for c in frame_cache if c.startswith(path + ".")]:
+        del frame_cache[cached]
+    for cached in glob.glob(glob.escape(path) + ".*.feather"):
+        os.remove(cached)
+
+
+def peak_memory():
+    """
+    :return: peak resident set size of this process in MB, or None where it is not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
 
-        df.columns = [a[:10] + "..." for a in df.columns]
-        print(df.to_string())
+
+IN_OUT_LABELS = ["OUT", "SAME", "IN"]
 
 
 def compare(a, b):
-    if a > b:
-        return "IN"
-    elif a < b:
-        return "OUT"
-    else:
-        return "SAME"
+    """
+    Column-wise version of the old row comparison: "IN" where a > b, "OUT" where a < b,
+    "SAME" otherwise (including missing values).
+    :return: categorical Series indexed like a
+    """
+    left = a.to_numpy()
+    right = b.to_numpy()
+    codes = (left > right).astype(np.int8) - (left < right).astype(np.int8) + 1
+    return pd.Series(pd.Categorical.from_codes(codes, categories=IN_OUT_LABELS), index=a.index)
+
+
+def select(condition, a, b):
+    """
+    Column-wise conditional pick: the value of a where condition holds, b otherwise.
+    :return: categorical Series indexed like a
+    """
+    values = np.where(condition.to_numpy(), a.to_numpy(), b.to_numpy())
+    return pd.Series(pd.Categorical(values), index=a.index)
+
+
+IN_OUT_COUNTS = {
+    'passenger_in_out': 'Passenger',
+    'freight_in_out': 'Freight',
+    'mail_in_out': 'Mail',
+}
+
+
+def crosstab_counts(keys, labels):
+    """
+    Count the IN and OUT labels of every label column per key in a single scan.
+    Each row is mapped to one cell of the (key, label, label, ...) joint table with
+    np.bincount and the per-column counts are read off its margins.
+    :param keys: Series of group keys, e.g. AustralianPort
+    :param labels: DataFrame of IN/OUT/SAME columns named as in IN_OUT_COUNTS
+    :return: DataFrame indexed by the sorted keys with an <X>InCount and <X>OutCount column
+            for every label column
+    """
+    key_codes, key_values = pd.factorize(keys, sort=True)
+    cell = key_codes.astype(np.int64)
+    for column in labels.columns:
+        codes = pd.Categorical(labels[column], categories=IN_OUT_LABELS).codes
+        cell = cell * len(IN_OUT_LABELS) + codes
+    shape = (len(key_values),) + (len(IN_OUT_LABELS),) * labels.shape[1]
+    joint = np.bincount(cell, minlength=int(np.prod(shape))).reshape(shape)
+
+    counts = pd.DataFrame(index=pd.Index(np.asarray(key_values, dtype=object), name=keys.name))
+    for axis, column in enumerate(labels.columns, start=1):
+        margin = joint.sum(axis=tuple(a for a in range(1, joint.ndim) if a != axis))
+        counts[IN_OUT_COUNTS[column] + 'InCount'] = margin[:, IN_OUT_LABELS.index('IN')]
+        counts[IN_OUT_COUNTS[column] + 'OutCount'] = margin[:, IN_OUT_LABELS.index('OUT')]
+    return counts
+
+
+COUNTRY_AVERAGES = {
+    'Passengers_in_average': 'Passengers_In',
+    'Passengers_out_average': 'Passengers_Out',
+    'Freight_in_average': 'Freight_In_(tonnes)',
+    'Freight_out_average': 'Freight_Out_(tonnes)',
+    'Mail_in_average': 'Mail_In_(tonnes)',
+    'Mail_out_average': 'Mail_Out_(tonnes)',
+}
+
+
+def format_2dp(df, columns):
+    """
+    Replace numeric columns in place with their 2 decimal string form, e.g. 1234.5 -> "1234.50".
+    Formatting is done over the whole column at once rather than per element.
+    """
+    for column in columns:
+        df[column] = np.char.mod('%.2f', df[column].to_numpy(dtype=np.float64)).astype(object)
 
 
+def as_object_keys(df):
+    """
+    Turn categorical columns into plain object columns. Every chunk of a streamed file has
+    its own categories, so partial aggregates are keyed by objects to line up when combined.
+    """
+    return df.astype({c: object for c in df.columns if isinstance(df[c].dtype, pd.CategoricalDtype)})
+
+
+def widen(df):
+    """
+    Upcast narrow integer columns to int64 so that sums cannot overflow.
+    """
+    return df.astype({c: np.int64 for c in df.columns if pd.api.types.is_integer_dtype(df[c])})
+
+
+def combine_totals(a, b):
+    """
+    Merge two partial aggregates indexed by group key by adding them up.
+    """
+    if a is None:
+        return b
+    return pd.concat([a, b]).groupby(level=list(range(a.index.nlevels))).sum()
+
+
+def combine_distinct(a, b):
+    """
+    Merge two partial sets of distinct rows.
+    """
+    if a is None:
+        return b
+    return pd.concat([a, b], ignore_index=True).drop_duplicates(ignore_index=True)
+
+
+def label_in_out(df1):
+    df1['passenger_in_out'] = compare(df1['Passengers_In'], df1['Passengers_Out'])
+    df1['freight_in_out'] = compare(df1['Freight_In_(tonnes)'], df1['Freight_Out_(tonnes)'])
+    df1['mail_in_out'] = compare(df1['Mail_In_(tonnes)'], df1['Mail_Out_(tonnes)'])
+    return df1
+
+
+def port_counts(df1):
+    return crosstab_counts(df1['AustralianPort'], df1[list(IN_OUT_COUNTS)])
+
+
+def port_counts_result(counts):
+    df2 = counts.sort_index().reset_index()
+    df2.sort_values(by='PassengerInCount', inplace=True, ascending=False, ignore_index=True)
+    return df2
+
+
+def country_totals(df1):
+    totals = widen(df1[list(COUNTRY_AVERAGES.values())]).groupby(df1['Country'], observed=True).sum()
+    totals.index = totals.index.astype(object)
+    return totals
+
+
+def distinct_months(df1):
+    return as_object_keys(df1[['Month']].drop_duplicates())
+
+
+def country_averages_result(totals, months):
+    df3 = totals.rename(columns={column: average for average, column in COUNTRY_AVERAGES.items()})
+    df3 = (df3[list(COUNTRY_AVERAGES)] / len(months)).reset_index()
+    df3.sort_values(by=['Passengers_in_average'], inplace=True, ascending=True, ignore_index=True)
+    format_2dp(df3, COUNTRY_AVERAGES)
+    return df3
+
+
+def foreign_port_pairs(df1):
+    pairs = df1.loc[df1['Passengers_Out'] > 0, ['Country', 'ForeignPort']].drop_duplicates()
+    return as_object_keys(pairs)
+
+
+def distinct_counts(keys, values):
+    """
+    Number of distinct non-missing values per non-missing key, by hashing (key, value) pairs to integer codes.
+    :return: Series indexed by the sorted keys
+    """
+    key_codes, key_values = pd.factorize(keys, sort=True)
+    value_codes, value_values = pd.factorize(values)
+    valid = (key_codes >= 0) & (value_codes >= 0)
+    cells = np.unique(key_codes[valid].astype(np.int64) * len(value_values) + value_codes[valid])
+    counts = np.bincount(cells // max(len(value_values), 1), minlength=len(key_values))
+    return pd.Series(counts, index=pd.Index(np.asarray(key_values, dtype=object), name=keys.name))
+
+
+# HyperLogLog sketches: 2 ** 12 registers per key, about 1.6% standard error on the distinct count
+SKETCH_PRECISION = 12
+
+
+def sketch(keys, values):
+    """
+    HyperLogLog sketch of the distinct non-missing values per key. Sketches of different chunks or
+    partitions merge with combine_sketches and are read with sketch_counts.
+    :return: DataFrame indexed by the sorted keys, one uint8 column per register
+    """
+    registers = 1 << SKETCH_PRECISION
+    key_codes, key_values = pd.factorize(keys, sort=True)
+    valid = (key_codes >= 0) & values.notna().to_numpy()
+    hashes = pd.util.hash_array(np.asarray(values, dtype=object)[valid])
+    bucket = (hashes >> np.uint64(64 - SKETCH_PRECISION)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - SKETCH_PRECISION)) - 1)
+    # position of the first 1 bit of the remaining 52 bits, which a float64 holds exactly
+    rank = (64 - SKETCH_PRECISION) - np.frexp(rest.astype(np.float64))[1] + 1
+
+    cell = key_codes[valid].astype(np.int64) * registers + bucket
+    highest = pd.Series(rank.astype(np.uint8)).groupby(cell).max()
+    table = np.zeros((len(key_values), registers), dtype=np.uint8)
+    table.reshape(-1)[highest.index.to_numpy()] = highest.to_numpy()
+    return pd.DataFrame(table, index=pd.Index(np.asarray(key_values, dtype=object), name=keys.name))
+
+
+def combine_sketches(a, b):
+    """
+    Merge two partial sketches, the register-wise maximum.
+    """
+    if a is None:
+        return b
+    return pd.concat([a, b]).groupby(level=0).max()
+
+
+def sketch_counts(sketches):
+    """
+    :return: Series of the estimated distinct count per key
+    """
+    registers = sketches.shape[1]
+    values = sketches.to_numpy(dtype=np.float64)
+    alpha = 0.7213 / (1 + 1.079 / registers)
+    estimate = alpha * registers ** 2 / np.exp2(-values).sum(axis=1)
+    zeros = (values == 0).sum(axis=1)
+    # small cardinalities are estimated better by counting empty registers
+    small = (estimate <= 2.5 * registers) & (zeros > 0)
+    estimate[small] = registers * np.log(registers / zeros[small])
+    return pd.Series(np.rint(estimate).astype(np.int64), index=sketches.index)
+
+
+def foreign_port_counts(pairs):
+    return distinct_counts(pairs['Country'], pairs['ForeignPort'])
+
+
+def foreign_port_sketches(df1):
+    flown = df1.loc[df1['Passengers_Out'] > 0, ['Country', 'ForeignPort']]
+    return sketch(flown['Country'], flown['ForeignPort'])
+
+
+def ranked_countries(counts):
+    """
+    The original ordering of question 4. Its sorts are not stable, so countries with equal counts
+    come out in the order these exact steps leave them in.
+    """
+    df4 = counts.sort_values(ascending=False)
+    df4 = df4.sort_values(ascending=False).groupby(df4.values).apply(
+        lambda x: x.sort_values())
+    df4 = df4.reset_index(name='Unique_ForeignPort_Count')[['Country', 'Unique_ForeignPort_Count']]
+    return df4.sort_values('Unique_ForeignPort_Count', ascending=False, ignore_index=True)
+
+
+def top_countries(counts, k=5):
+    """
+    The k countries with the highest count. The k + 1 highest are picked by partial selection; only
+    if there is a tie among them is the original ordering run over all countries, so that tied
+    countries keep the order question 4 has always produced.
+    :param counts: Series of counts indexed by Country
+    """
+    values = counts.to_numpy()
+    candidates = np.argpartition(-values, k)[:k + 1] if len(values) > k else np.arange(len(values))
+    candidates = candidates[np.argsort(-values[candidates], kind='stable')]
+    if len(np.unique(values[candidates])) < len(candidates):
+        return ranked_countries(counts).head(k)
+    top = candidates[:k]
+    return pd.DataFrame({'Country': counts.index[top], 'Unique_ForeignPort_Count': values[top]})
+
+
+ROUTE_KEYS = ['Airline', 'Australian_City', 'International_City']
+
+
+def route_seat_totals(df5):
+    totals = widen(df5[['Max_Seats']]).groupby([df5[k] for k in ROUTE_KEYS], observed=True)['Max_Seats'].agg(
+        Total_Seats='sum',
+        Seat_Rows='count',
+    )
+    return as_object_keys(totals.reset_index()).set_index(ROUTE_KEYS)
+
+
+def route_seats_result(totals):
+    df6 = totals.sort_index().reset_index()
+    df6['Avg_Seats'] = df6['Total_Seats'] / df6.pop('Seat_Rows')
+    df6['Route'] = df6['Australian_City'] + ' - ' + df6['International_City'].fillna('')
+    competition_data = df6.groupby(['Australian_City', 'International_City']).agg(
+        Competition=('Airline', 'count')
+    ).reset_index()
+    df6 = df6.merge(competition_data, on=['Australian_City', 'International_City'], how='left')
+    df6['Avg_Seats'] = df6['Avg_Seats'].round(2)
+    return df6[['Airline', 'Route', 'Total_Seats', 'Avg_Seats', 'Competition']]
+
+
+@instrumented
 def question_1(city_pairs):
     """
     :return: df1
@@ -41,18 +495,14 @@ def question_1(city_pairs):
     """
 
     #################################################
-    df1 = pd.read_csv(city_pairs)
-    df1['passenger_in_out'] = df1.apply(lambda x: compare(x.Passengers_In, x.Passengers_Out), axis = 1)
-    df1.rename(columns={'Freight_In_(tonnes)':'fin', 'Freight_Out_(tonnes)':'fout', 'Mail_In_(tonnes)':'mailin', 'Mail_Out_(tonnes)':'mout'}, inplace=True)
-    df1['freight_in_out'] = df1.apply(lambda y: compare(y.fin, y.fout), axis = 1)
-    df1['mail_in_out'] = df1.apply(lambda z: compare(z.mailin, z.mout), axis = 1)
-    df1.rename(columns={'fin':'Freight_In_(tonnes)', 'fout':'Freight_Out_(tonnes)', 'mailin':'Mail_In_(tonnes)', 'mout':'Mail_Out_(tonnes)'}, inplace=True)
+    df1 = label_in_out(load_typed(city_pairs, CITY_PAIRS_DTYPES))
     #################################################
 
     log("QUESTION 1", output_df=df1[["AustralianPort", "ForeignPort", "passenger_in_out", "freight_in_out", "mail_in_out"]], other=df1.shape)
     return df1
 
 
+@instrumented
 def question_2(df1):
     """
     :param df1: the dataframe created in question 1
@@ -61,35 +511,14 @@ def question_2(df1):
     """
 
     #################################################
-    a = sorted(list(set(df1['AustralianPort'].tolist())))
-    data = {'AustralianPort': a}
-    df2 = pd.DataFrame(data)
-    result1 = []
-    result2 = []
-    result3 = []
-    result4 = []
-    result5 = []
-    result6 = []
-    for i in a:
-        result1.append(((df1['AustralianPort'] == i) & (df1['passenger_in_out'] == 'IN')).sum())
-        result2.append(((df1['AustralianPort'] == i) & (df1['passenger_in_out'] == 'OUT')).sum())
-        result3.append(((df1['AustralianPort'] == i) & (df1['freight_in_out'] == 'IN')).sum())
-        result4.append(((df1['AustralianPort'] == i) & (df1['freight_in_out'] == 'OUT')).sum())
-        result5.append(((df1['AustralianPort'] == i) & (df1['mail_in_out'] == 'IN')).sum())
-        result6.append(((df1['AustralianPort'] == i) & (df1['mail_in_out'] == 'OUT')).sum())
-    df2['PassengerInCount'] = result1
-    df2['PassengerOutCount'] = result2
-    df2['FreightInCount'] = result3
-    df2['FreightOutCount'] = result4
-    df2['MailInCount'] = result5
-    df2['MailOutCount'] = result6
-    df2.sort_values(by='PassengerInCount', inplace=True, ascending=False, ignore_index=True)
+    df2 = port_counts_result(port_counts(df1))
     #################################################
 
     log("QUESTION 2", output_df=df2, other=df2.shape)
     return df2
 
 
+@instrumented
 def question_3(df1):
     """
     :param df1: the dataframe created in question 1
@@ -98,69 +527,36 @@ def question_3(df1):
             Please read the assignment specs to know how to create the output dataframe
     """
     #################################################
-    a = sorted(list(set(df1['Country'].tolist())))
-    data = {'Country': a}
-    df3 = pd.DataFrame(data)
-    r1 = df1.groupby('Country')['Passengers_In'].agg(['sum']).reset_index()
-    result1 = list(r1['sum']/453)
-    df3['Passengers_in_average'] = result1
-    r2 = df1.groupby('Country')['Passengers_Out'].agg(['sum']).reset_index()
-    result2 = list(r2['sum']/453)
-    df3['Passengers_out_average'] = result2
-    df3['Passengers_out_average'] = df3['Passengers_out_average'].map(lambda x: f'{x:,.2f}')
-    df3['Passengers_out_average'] = df3['Passengers_out_average'].str.replace(',', '')
-    r3 = df1.groupby('Country')['Freight_In_(tonnes)'].agg(['sum']).reset_index()
-    result3 = list(r3['sum']/453)
-    df3['Freight_in_average'] = result3
-    df3['Freight_in_average'] = df3['Freight_in_average'].map(lambda x: f'{x:,.2f}')
-    df3['Freight_in_average'] = df3['Freight_in_average'].str.replace(',', '')
-    r4 = df1.groupby('Country')['Freight_Out_(tonnes)'].agg(['sum']).reset_index()
-    result4 = list(r4['sum'] / 453)
-    df3['Freight_out_average'] = result4
-    df3['Freight_out_average'] = df3['Freight_out_average'].map(lambda x: f'{x:,.2f}')
-    df3['Freight_out_average'] = df3['Freight_out_average'].str.replace(',', '')
-    r5 = df1.groupby('Country')['Mail_In_(tonnes)'].agg(['sum']).reset_index()
-    result5 = list(r5['sum'] / 453)
-    df3['Mail_in_average'] = result5
-    df3['Mail_in_average'] = df3['Mail_in_average'].map(lambda x: f'{x:,.2f}')
-    df3['Mail_in_average'] = df3['Mail_in_average'].str.replace(',', '')
-    r6 = df1.groupby('Country')['Mail_Out_(tonnes)'].agg(['sum']).reset_index()
-    result6 = list(r6['sum'] / 453)
-    df3['Mail_out_average'] = result6
-    df3['Mail_out_average'] = df3['Mail_out_average'].map(lambda x: f'{x:,.2f}')
-    df3['Mail_out_average'] = df3['Mail_out_average'].str.replace(',', '')
-    df3.sort_values(by=['Passengers_in_average'], inplace=True, ascending=True, ignore_index=True)
-    df3['Passengers_in_average'] = df3['Passengers_in_average'].map(lambda x:f'{x:,.2f}')
-    df3['Passengers_in_average'] = df3['Passengers_in_average'].str.replace(',', '')
+    df3 = country_averages_result(country_totals(df1), distinct_months(df1))
     #################################################
 
     log("QUESTION 3", output_df=df3, other=df3.shape)
     return df3
 
 
-def question_4(df1):
+@instrumented
+def question_4(df1, approximate=False):
     """
     :param df1: the dataframe created in question 1
+    :param approximate: count distinct foreign ports with HyperLogLog sketches instead of exactly
     :return: df4
             Data Type: Dataframe
             Please read the assignment specs to know how to create the output dataframe
     """
 
     #################################################
-    new_df = df1[['AustralianPort', 'Country', 'ForeignPort', 'Month', 'Passengers_Out']].copy()
-    new_df = new_df[new_df['Passengers_Out'] > 0].drop_duplicates(['AustralianPort', 'Country', 'Month', 'ForeignPort'])
-    df4 = new_df.groupby(['Country'])['ForeignPort'].nunique().sort_values(ascending=False)
-    df4 = df4.sort_values(ascending=False).groupby(df4.values).apply(
-        lambda x: x.sort_values())
-    df4 = df4.reset_index(name='Unique_ForeignPort_Count')[['Country', 'Unique_ForeignPort_Count']]
-    df4 = df4.sort_values('Unique_ForeignPort_Count', ascending=False, ignore_index=True)
-    df4 = df4.head(5)
+    if approximate:
+        counts = sketch_counts(foreign_port_sketches(df1))
+    else:
+        counts = foreign_port_counts(foreign_port_pairs(df1))
+    df4 = top_countries(counts)
     #################################################
 
     log("QUESTION 4", output_df=df4, other=df4.shape)
     return df4
 
 
+@instrumented
 def question_5(seats):
     """
     :param seats : the path to dataset
@@ -169,15 +565,17 @@ def question_5(seats):
             Please read the assignment specs to know how to create the  output dataframe
     """
     #################################################
-    df5 = pd.read_csv(seats)
-    df5['Source_City'] = df5.apply(lambda x: x.International_City if x.In_Out == 'I' else x.Australian_City, axis=1)
-    df5['Destination_City'] = df5.apply(lambda y: y.Australian_City if y.In_Out == 'I' else y.International_City, axis=1)
+    df5 = load_typed(seats, SEATS_DTYPES)
+    inbound = df5['In_Out'] == 'I'
+    df5['Source_City'] = select(inbound, df5['International_City'], df5['Australian_City'])
+    df5['Destination_City'] = select(inbound, df5['Australian_City'], df5['International_City'])
     #################################################
 
     log("QUESTION 5", output_df=df5, other=df5.shape)
     return df5
 
 
+@instrumented
 def question_6(df5):
     """
     :param df5: the dataframe created in question 5
@@ -194,28 +592,57 @@ def question_6(df5):
     departure city and destination city, that is, how many airlines are operating this route, so as 
     to judge the risk of opening the same route.
     """
-
-    df6 = df5.groupby(['Airline', 'Australian_City', 'International_City']).agg(
-        Total_Seats=('Max_Seats', 'sum'),
-        Avg_Seats=('Max_Seats', 'mean'),
-    ).reset_index()
-    df6['Route'] = df6['Australian_City'] + ' - ' + df6['International_City'].fillna('')
-    competition_data = df6.groupby(['Australian_City', 'International_City']).agg(
-        Competition=('Airline', 'count')
-    ).reset_index()
-    df6 = df6.merge(competition_data, on=['Australian_City', 'International_City'], how='left')
-    df6['Avg_Seats'] = df6['Avg_Seats'].round(2)
-    df6 = df6[['Airline', 'Route', 'Total_Seats', 'Avg_Seats', 'Competition']]
+    df6 = route_seats_result(route_seat_totals(df5))
     #################################################
 
     log("QUESTION 6", output_df=df6, other=df6.shape)
     return df6
 
 
-def question_7(seats, city_pairs):
+MONTH_KEYS = ['Month', 'Year', 'Month_num']
+
+
+def monthly_passengers(city_pairs):
+    grouped = widen(city_pairs[['Passengers_In', 'Passengers_Out']]).groupby(
+        [city_pairs[k] for k in MONTH_KEYS], observed=True)
+    totals = grouped.sum()
+    totals['Routes'] = grouped.size()
+    return as_object_keys(totals.reset_index()).set_index(MONTH_KEYS)
+
+
+def monthly_region_seats(seats):
+    grouped = widen(seats[['Max_Seats']]).groupby(
+        [seats[k] for k in MONTH_KEYS + ['Port_Region']], observed=True)
+    totals = grouped.sum()
+    totals['Seat_Rows'] = grouped.size()
+    return as_object_keys(totals.reset_index()).set_index(MONTH_KEYS + ['Port_Region'])
+
+
+def region_utilisation(passengers, seats):
+    """
+    Yearly Passengers_In, Passengers_Out and Max_Seats per Port_Region, equal to summing the
+    month-by-month join of every city_pairs row with every seats row, computed from the
+    monthly totals instead: each passenger total is counted once per seats row of the region
+    in that month, and each seat total once per city_pairs row of that month.
+    :param passengers: monthly_passengers of city_pairs
+    :param seats: monthly_region_seats of seats
+    """
+    joined = seats.reset_index().merge(passengers.reset_index(), on=MONTH_KEYS)
+    joined['Passengers_In'] *= joined['Seat_Rows']
+    joined['Passengers_Out'] *= joined['Seat_Rows']
+    joined['Max_Seats'] *= joined['Routes']
+    grouped_data = joined.groupby(['Port_Region', 'Year'])[['Passengers_In', 'Passengers_Out', 'Max_Seats']].sum()
+    grouped_data = grouped_data.reset_index()
+    grouped_data['Year'] = grouped_data['Year'].astype(str)
+    return grouped_data
+
+
+@instrumented
+def question_7(seats, city_pairs, chunksize=None):
     """
     :param seats: the path to dataset
     :param city_pairs : the path to dataset
+    :param chunksize: if given, aggregate both files chunk by chunk instead of loading them
     :return: nothing, but saves the figure on the disk
     """
 
@@ -227,13 +654,24 @@ def question_7(seats, city_pairs):
     Draw a line at 100% utilization to help compare the size. This visualization will help 
     us understand the trend of seat utilization around the world.
     """
-    seats = pd.read_csv(seats, dtype={'Year': str})
-    city_pairs = pd.read_csv(city_pairs, dtype={'Year': str})
-
-    merged_data = pd.merge(city_pairs, seats, on=['Month', 'Year', 'Month_num'])
-    grouped_data = merged_data[['Port_Region', 'Year', 'Passengers_In', 'Passengers_Out', 'Max_Seats']].groupby(
-        ['Port_Region', 'Year']).sum().reset_index()
-    fig, axes = plt.subplots(nrows=2, ncols=5, figsize=(30, 8))
+    if chunksize is None:
+        passengers = monthly_passengers(load_typed(city_pairs, CITY_PAIRS_DTYPES))
+        region_seats = monthly_region_seats(load_typed(seats, SEATS_DTYPES))
+    else:
+        passengers = region_seats = None
+        for chunk in read_typed(city_pairs, CITY_PAIRS_DTYPES, usecols=MONTH_KEYS + ['Passengers_In', 'Passengers_Out'],
+                                chunksize=chunksize):
+            passengers = combine_totals(passengers, monthly_passengers(chunk))
+        for chunk in read_typed(seats, SEATS_DTYPES, usecols=MONTH_KEYS + ['Port_Region', 'Max_Seats'],
+                                chunksize=chunksize):
+            region_seats = combine_totals(region_seats, monthly_region_seats(chunk))
+
+    grouped_data = region_utilisation(passengers, region_seats)
+    # imported here so the tabular questions do not pay for loading matplotlib;
+    # pyplot keeps global state, build the figure directly so this can run off the main thread
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(30, 8))
+    axes = fig.subplots(nrows=2, ncols=5)
     regions = grouped_data['Port_Region'].unique()
 
     for i, ax in enumerate(axes.flatten()):
@@ -248,17 +686,244 @@ def question_7(seats, city_pairs):
         ax.set_xticks(region_data['Year'][::2])
         ax.set_xticklabels(region_data['Year'][::2])
 
-    plt.tight_layout()
+    fig.tight_layout()
     #################################################
 
-    plt.savefig("{}-Q7.png".format(studentid))
+    fig.savefig("{}-Q7.png".format(studentid))
+
+
+# Aggregate state behind df2, df3, df4 and df6: the partial aggregates of every row folded in so
+# far, keyed by name, with the function that merges two of them.
+STATE_VERSION = 1
+STATE_PARTS = {
+    'port_counts': combine_totals,
+    'country_totals': combine_totals,
+    'months': combine_distinct,
+    'foreign_ports': combine_distinct,
+    'route_seats': combine_totals,
+    'seat_months': combine_distinct,
+}
+
+
+def empty_state(approximate=False):
+    """
+    :param approximate: keep HyperLogLog sketches of the foreign ports instead of the distinct pairs
+    """
+    state = {part: None for part in STATE_PARTS}
+    state.update(version=STATE_VERSION, approximate=approximate)
+    return state
+
+
+def merge_states(a, b):
+    """
+    :return: a new state holding the rows of both a and b
+    """
+    if a['approximate'] != b['approximate']:
+        raise ValueError("cannot merge an exact and an approximate aggregate state")
+    merged = dict(a)
+    for part, combine in STATE_PARTS.items():
+        if part == 'foreign_ports' and a['approximate']:
+            combine = combine_sketches
+        if b[part] is not None:
+            merged[part] = combine(a[part], b[part])
+    return merged
+
+
+def accumulate(state, city_pairs, seats, chunksize=CHUNKSIZE):
+    """
+    Fold every row of both files into state chunk by chunk.
+    :return: the updated state; state itself is left unchanged
+    """
+    usecols = [c for c in CITY_PAIRS_DTYPES if c not in ('Year', 'Month_num')]
+    for chunk in read_typed(city_pairs, CITY_PAIRS_DTYPES, usecols=usecols, chunksize=chunksize):
+        label_in_out(chunk)
+        state = merge_states(state, dict(
+            empty_state(state['approximate']),
+            port_counts=port_counts(chunk),
+            country_totals=country_totals(chunk),
+            months=distinct_months(chunk),
+            foreign_ports=foreign_port_sketches(chunk) if state['approximate'] else foreign_port_pairs(chunk),
+        ))
+
+    usecols = ROUTE_KEYS + ['Max_Seats', 'Month']
+    for chunk in read_typed(seats, SEATS_DTYPES, usecols=usecols, chunksize=chunksize):
+        state = merge_states(state, dict(
+            empty_state(state['approximate']),
+            route_seats=route_seat_totals(chunk),
+            seat_months=distinct_months(chunk),
+        ))
+    return state
+
+
+def state_results(state):
+    """
+    :return: df2, df3, df4, df6 of all the rows folded into state
+    """
+    df2 = port_counts_result(state['port_counts'])
+    log("QUESTION 2", output_df=df2, other=df2.shape)
+    df3 = country_averages_result(state['country_totals'], state['months'])
+    log("QUESTION 3", output_df=df3, other=df3.shape)
+    if state['approximate']:
+        df4 = top_countries(sketch_counts(state['foreign_ports']))
+    else:
+        df4 = top_countries(foreign_port_counts(state['foreign_ports']))
+    log("QUESTION 4", output_df=df4, other=df4.shape)
+    df6 = route_seats_result(state['route_seats'])
+    log("QUESTION 6", output_df=df6, other=df6.shape)
+    return df2, df3, df4, df6
+
+
+@instrumented
+def stream_questions(city_pairs, seats, chunksize=CHUNKSIZE, approximate=False):
+    """
+    Streaming counterpart of questions 1 to 6 for files larger than memory. Both files are read
+    chunk by chunk and only the partial aggregates behind df2, df3, df4 and df6 are kept.
+    :param city_pairs: the path to dataset
+    :param seats: the path to dataset
+    :param approximate: as in question_4
+    :return: df2, df3, df4, df6
+    """
+    return state_results(accumulate(empty_state(approximate), city_pairs, seats, chunksize))
+
+
+def load_state(path, approximate=False):
+    """
+    :return: the aggregate state saved at path, or an empty one if there is none yet
+    """
+    if not os.path.exists(path):
+        return empty_state(approximate)
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('version') != STATE_VERSION:
+        raise ValueError("{} was written by another version of a1.py, rebuild it from the full files".format(path))
+    return state
+
+
+def save_state(state, path):
+    # write next to the target and rename, so an interrupted run never leaves a broken state
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+@instrumented
+def append_month(state_path, city_pairs, seats, chunksize=CHUNKSIZE, approximate=False):
+    """
+    Fold a new slice of city_pairs and seats rows, e.g. one month, into the aggregate state saved at
+    state_path and compute df2, df3, df4 and df6 for all history from it without reading the
+    history again. Starting without a state file builds it from whatever files are given.
+    :return: df2, df3, df4, df6
+    """
+    state = load_state(state_path, approximate)
+    if state['approximate'] != approximate:
+        raise ValueError("{} holds {} foreign port counts".format(
+            state_path, "approximate" if state['approximate'] else "exact"))
+    new = accumulate(empty_state(approximate), city_pairs, seats, chunksize)
+
+    # adding a month twice would silently double its sums
+    for part in ('months', 'seat_months'):
+        if state[part] is not None and new[part] is not None:
+            repeated = state[part].merge(new[part])
+            if len(repeated):
+                raise ValueError("months already in {}: {}".format(state_path, ", ".join(repeated['Month'])))
+
+    state = merge_states(state, new)
+    save_state(state, state_path)
+    return state_results(state)
+
+
+def run_pipeline(stages, workers=None):
+    """
+    Run a dependency graph of stages on a thread pool, each stage as soon as all of its
+    dependencies have finished. Results are handed to dependent stages as they are, without
+    copying; pandas copy-on-write is switched on for the run so that a stage can never change
+    a frame another stage is reading.
+    :param stages: dict of name -> (function, [names of dependencies]); the function is called
+            with the results of its dependencies as positional arguments
+    :param workers: maximum number of stages running at once
+    :return: dict of name -> result
+    """
+    results = {}
+    timings = {}
+    pending = dict(stages)
+    running = {}
+    start = time.perf_counter()
+
+    def timed(name, func, *args):
+        began = time.perf_counter()
+        result = func(*args)
+        timings[name] = (began - start, time.perf_counter() - began)
+        return result
+
+    with pd.option_context('mode.copy_on_write', True), ThreadPoolExecutor(max_workers=workers) as pool:
+        while pending or running:
+            for name, (func, dependencies) in list(pending.items()):
+                if all(d in results for d in dependencies):
+                    running[pool.submit(timed, name, func, *[results[d] for d in dependencies])] = name
+                    del pending[name]
+            if not running:
+                raise ValueError("stages {} depend on unknown or cyclic stages".format(sorted(pending)))
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+
+    report = ["{:<12} started at {:7.2f}s, took {:7.2f}s".format(name, *timings[name])
+              for name in sorted(timings, key=lambda n: timings[n][0])]
+    report.append("{:<12} {:7.2f}s".format("total", time.perf_counter() - start))
+    log("STAGE TIMES", output_df=None, other="\n" + "\n".join(report))
+    return results
 
 
 if __name__ == "__main__":
-    df1 = question_1("city_pairs.csv")
-    df2 = question_2(df1.copy(True))
-    df3 = question_3(df1.copy(True))
-    df4 = question_4(df1.copy(True))
-    df5 = question_5("seats.csv")
-    df6 = question_6(df5.copy(True))
-    question_7("seats.csv", "city_pairs.csv")
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stream', action='store_true',
+                        help='compute questions 2, 3, 4 and 6 chunk by chunk without loading the full files')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE, help='rows per chunk in --stream and --append mode')
+    parser.add_argument('--clear-cache', action='store_true', help='drop the cached parses of both files first')
+    parser.add_argument('--append', nargs=2, metavar=('CITY_PAIRS', 'SEATS'), default=None,
+                        help='fold the rows of these files into the saved aggregate state and report '
+                             'questions 2, 3, 4 and 6 for all rows folded in so far')
+    parser.add_argument('--state', default='a1_state.pkl', help='aggregate state file used by --append')
+    parser.add_argument('--approx-distinct', action='store_true',
+                        help='estimate the distinct foreign ports of question 4 with HyperLogLog sketches')
+    parser.add_argument('--jobs', type=int, default=None, help='maximum number of questions running at once')
+    parser.add_argument('--metrics', default=None,
+                        help='append a JSON lines record per question to this file, - for stdout')
+    parser.add_argument('--production', action='store_true', help='do not print previews of the output frames')
+    args = parser.parse_args()
+
+    preview = not args.production
+    if args.metrics == '-':
+        metrics_file = sys.stdout
+    elif args.metrics is not None:
+        metrics_file = open(args.metrics, 'a')
+
+    if args.clear_cache:
+        clear_cache("city_pairs.csv")
+        clear_cache("seats.csv")
+
+    if args.append:
+        stages = {
+            'append': (functools.partial(append_month, args.state, *args.append, args.chunksize,
+                                         args.approx_distinct), []),
+        }
+    elif args.stream:
+        stages = {
+            'stream': (functools.partial(stream_questions, "city_pairs.csv", "seats.csv", args.chunksize,
+                                         args.approx_distinct), []),
+            'question_7': (functools.partial(question_7, "seats.csv", "city_pairs.csv", args.chunksize), []),
+        }
+    else:
+        stages = {
+            'question_1': (functools.partial(question_1, "city_pairs.csv"), []),
+            'question_2': (question_2, ['question_1']),
+            'question_3': (question_3, ['question_1']),
+            'question_4': (functools.partial(question_4, approximate=args.approx_distinct), ['question_1']),
+            'question_5': (functools.partial(question_5, "seats.csv"), []),
+            'question_6': (question_6, ['question_5']),
+            'question_7': (functools.partial(question_7, "seats.csv", "city_pairs.csv"), []),
+        }
+    results = run_pipeline(stages, args.jobs)
+
+    peak = peak_memory()
+    log("PEAK MEMORY", output_df=None, other="{:.1f} MB".format(peak) if peak is not None else "unavailable")
\ No newline at end of file
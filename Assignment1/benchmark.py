@@ -0,0 +1,129 @@
+"""
+Times and memory-profiles every question_N function of a1.py on generated data of increasing
+size and stores the results as JSON, together with a fitted scaling exponent per question so
+that superlinear behaviour shows up next to the absolute numbers.
+
+    python benchmark.py --sizes 10000 100000 1000000 --output benchmark.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import a1
+from generate_data import generate
+
+QUESTIONS = ['question_1', 'question_2', 'question_3', 'question_4', 'question_5', 'question_6', 'question_7']
+
+
+def run_question(name, inputs):
+    """
+    Run one question on the generated files in the current directory with its output suppressed.
+    Questions that parse a file start from a cold cache.
+    """
+    if name in ('question_1', 'question_5', 'question_7'):
+        a1.clear_cache('city_pairs.csv')
+        a1.clear_cache('seats.csv')
+    with contextlib.redirect_stdout(io.StringIO()):
+        if name == 'question_1':
+            return a1.question_1('city_pairs.csv')
+        if name == 'question_5':
+            return a1.question_5('seats.csv')
+        if name == 'question_7':
+            return a1.question_7('seats.csv', 'city_pairs.csv')
+        source = inputs['question_5' if name == 'question_6' else 'question_1']
+        return getattr(a1, name)(source)
+
+
+def measure(name, inputs, memory):
+    """
+    :return: result of the question and a record of its wall time and, if memory is set, the peak
+            traced allocation; memory is measured in a second run as tracing slows the code down
+    """
+    began = time.perf_counter()
+    result = run_question(name, inputs)
+    record = {'question': name, 'seconds': time.perf_counter() - began}
+    if memory:
+        tracemalloc.start()
+        run_question(name, inputs)
+        record['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, record
+
+
+def scaling(results):
+    """
+    Fit seconds ~ rows ** exponent per question over all measured sizes.
+    """
+    fits = {}
+    df = pd.DataFrame(results)
+    for name, runs in df.groupby('question'):
+        if runs['rows'].nunique() < 2:
+            continue
+        exponent = np.polyfit(np.log(runs['rows']), np.log(runs['seconds'].clip(lower=1e-6)), 1)[0]
+        fits[name] = {'exponent': round(float(exponent), 3), 'scaling': 'linear' if exponent < 1.2 else 'superlinear'}
+    return fits
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def benchmark(sizes, data_dir, memory=True, seed=0):
+    results = []
+    cwd = os.getcwd()
+    for rows in sizes:
+        directory = os.path.join(data_dir, str(rows))
+        if not os.path.exists(os.path.join(directory, 'seats.csv')):
+            print("generating {} rows in {}".format(rows, directory))
+            generate(directory, rows, seed=seed)
+        os.chdir(directory)
+        try:
+            inputs = {}
+            for name in QUESTIONS:
+                inputs[name], record = measure(name, inputs, memory)
+                record['rows'] = rows
+                results.append(record)
+                print("{:>12} rows  {:<11} {:9.3f}s{}".format(
+                    rows, name, record['seconds'],
+                    "  {:9.1f} MB".format(record['peak_mb']) if 'peak_mb' in record else ""))
+        finally:
+            os.chdir(cwd)
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': results,
+        'scaling': scaling(results),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='rows of the generated files, e.g. 10000 up to 100000000')
+    parser.add_argument('--data-dir', default='benchmark_data', help='where generated files are kept between runs')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--no-memory', action='store_true', help='skip the traced memory runs')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    report = benchmark(args.sizes, os.path.abspath(args.data_dir), not args.no_memory, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, fit in report['scaling'].items():
+        print("{:<11} exponent {:.2f} ({})".format(name, fit['exponent'], fit['scaling']))
@@ -0,0 +1,132 @@
+"""
+Writes synthetic city_pairs.csv and seats.csv files with the same columns, value formats and
+roughly the same port, country, region and airline cardinalities as the real extracts, so a1.py
+can be measured at production volume.
+
+    python generate_data.py --rows 1000000 --out data/1m
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+AUSTRALIAN_PORTS = [
+    'Adelaide', 'Brisbane', 'Broome', 'Cairns', 'Canberra', 'Christmas Island', 'Darwin', 'Gold Coast',
+    'Hobart', 'Melbourne', 'Newcastle', 'Norfolk Island', 'Perth', 'Port Hedland', 'Sunshine Coast',
+    'Sydney', 'Townsville', 'Avalon', 'Karratha', 'Learmonth',
+]
+REGIONS = [
+    'Africa', 'Europe', 'Japan', 'Middle East', 'New Zealand', 'North America', 'North East Asia',
+    'Pacific', 'South East Asia', 'Southern Asia',
+]
+COUNTRIES = 60
+FOREIGN_PORTS = 150
+AIRLINES = 80
+MONTHS = pd.date_range('1985-01-01', '2022-09-01', freq='MS')
+CHUNK_ROWS = 1_000_000
+
+
+def foreign_ports(rng):
+    """
+    :return: DataFrame of foreign port, country and region, several ports per country
+    """
+    countries = ['Country {:02d}'.format(i) for i in range(COUNTRIES)]
+    country_region = {c: REGIONS[i % len(REGIONS)] for i, c in enumerate(countries)}
+    # a few countries own most of the ports, as in the real data
+    weights = 1 / np.arange(1, COUNTRIES + 1)
+    port_countries = rng.choice(countries, size=FOREIGN_PORTS, p=weights / weights.sum())
+    return pd.DataFrame({
+        'ForeignPort': ['Port {:03d}'.format(i) for i in range(FOREIGN_PORTS)],
+        'Country': port_countries,
+        'Port_Region': [country_region[c] for c in port_countries],
+    })
+
+
+def skewed(rng, size, scale, zeros, decimals=0):
+    """
+    Heavy tailed non-negative amounts rounded to decimals, with a share of exact zeros.
+    """
+    values = np.round(rng.pareto(1.5, size) * scale, decimals)
+    values[rng.random(size) < zeros] = 0
+    return values
+
+
+def city_pairs_chunk(rng, ports, rows):
+    months = MONTHS[rng.integers(0, len(MONTHS), rows)]
+    foreign = ports.iloc[rng.integers(0, len(ports), rows)]
+    df = pd.DataFrame({
+        'Month': months.strftime('%b-%y'),
+        'AustralianPort': rng.choice(AUSTRALIAN_PORTS, size=rows),
+        'ForeignPort': foreign['ForeignPort'].to_numpy(),
+        'Country': foreign['Country'].to_numpy(),
+        'Passengers_In': skewed(rng, rows, 2000, 0.15).astype(np.int64),
+        'Freight_In_(tonnes)': skewed(rng, rows, 20, 0.3, decimals=3),
+        'Mail_In_(tonnes)': skewed(rng, rows, 2, 0.5, decimals=3),
+        'Passengers_Out': skewed(rng, rows, 2000, 0.15).astype(np.int64),
+        'Freight_Out_(tonnes)': skewed(rng, rows, 20, 0.3, decimals=3),
+        'Mail_Out_(tonnes)': skewed(rng, rows, 2, 0.5, decimals=3),
+        'Year': months.year,
+        'Month_num': months.month,
+    })
+    # some routes are exactly balanced, so every IN/OUT/SAME label occurs
+    same = rng.random(rows) < 0.05
+    df.loc[same, 'Passengers_Out'] = df.loc[same, 'Passengers_In']
+    return df
+
+
+def seats_chunk(rng, ports, rows):
+    months = MONTHS[rng.integers(0, len(MONTHS), rows)]
+    foreign = ports.iloc[rng.integers(0, len(ports), rows)]
+    australian = rng.choice(AUSTRALIAN_PORTS, size=rows)
+    international = foreign['ForeignPort'].to_numpy().astype(object)
+    in_out = np.where(rng.random(rows) < 0.5, 'I', 'O')
+    stops = rng.choice([0, 1, 2], size=rows, p=[0.8, 0.15, 0.05])
+    flights = rng.integers(1, 120, rows)
+    return pd.DataFrame({
+        'Month': months.strftime('%b-%y'),
+        'In_Out': in_out,
+        'Australian_City': australian,
+        'International_City': international,
+        'Airline': rng.choice(['Airline {:02d}'.format(i) for i in range(AIRLINES)], size=rows),
+        'Route': np.char.add(np.char.add(australian.astype(str), '-'), international.astype(str)),
+        'Port_Country': foreign['Country'].to_numpy(),
+        'Port_Region': foreign['Port_Region'].to_numpy(),
+        'Service_Country': foreign['Country'].to_numpy(),
+        'Service_Region': foreign['Port_Region'].to_numpy(),
+        'Stops': stops,
+        'All_Flights': flights,
+        'Max_Seats': flights * rng.integers(150, 450, rows),
+        'Year': months.year,
+        'Month_num': months.month,
+    })
+
+
+def write_csv(path, make_chunk, rows):
+    written = 0
+    while written < rows:
+        chunk = make_chunk(min(CHUNK_ROWS, rows - written))
+        chunk.to_csv(path, mode='w' if written == 0 else 'a', header=written == 0, index=False)
+        written += len(chunk)
+
+
+def generate(out, rows, seats_rows=None, seed=0):
+    """
+    Write city_pairs.csv with rows rows and seats.csv with seats_rows rows (default rows) into out.
+    """
+    rng = np.random.default_rng(seed)
+    ports = foreign_ports(rng)
+    os.makedirs(out, exist_ok=True)
+    write_csv(os.path.join(out, 'city_pairs.csv'), lambda n: city_pairs_chunk(rng, ports, n), rows)
+    write_csv(os.path.join(out, 'seats.csv'), lambda n: seats_chunk(rng, ports, n),
+              rows if seats_rows is None else seats_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, required=True, help='rows of city_pairs.csv')
+    parser.add_argument('--seats-rows', type=int, default=None, help='rows of seats.csv, default --rows')
+    parser.add_argument('--out', default='.', help='directory to write both files into')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.out, args.rows, args.seats_rows, args.seed)
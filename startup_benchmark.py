@@ -0,0 +1,98 @@
+"""
+Measures the cold start of each assignment script: the time to import it in a fresh interpreter
+and the heaviest top-level packages it pulls in (from python -X importtime). With --baseline the
+same is measured for the scripts as they were at another git revision, to show the difference.
+
+    python startup_benchmark.py --baseline HEAD~1 --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = ['Assignment1/a1.py', 'Assignment 2/a2.py', 'Assignment 3/z5414592.py']
+TIMER = "import sys, time; sys.path.insert(0, {directory!r}); start = time.perf_counter(); import {module}; " \
+        "print(time.perf_counter() - start)"
+
+
+def import_seconds(path, runs):
+    directory, module = os.path.split(path)
+    module = os.path.splitext(module)[0]
+    times = []
+    for _ in range(runs):
+        done = subprocess.run([sys.executable, '-c', TIMER.format(directory=directory, module=module)],
+                              cwd=directory, capture_output=True, text=True)
+        if done.returncode != 0:
+            raise RuntimeError(done.stderr.strip().splitlines()[-1])
+        times.append(float(done.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def heaviest_imports(path, top=5):
+    """
+    :return: the top-level packages with the largest cumulative import time, in seconds
+    """
+    directory, module = os.path.split(path)
+    done = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + os.path.splitext(module)[0]],
+                          cwd=directory, capture_output=True, text=True)
+    packages = {}
+    for line in done.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nesting is shown by two spaces of indent per level, keep what the script imports itself
+        if len(name) - len(name.lstrip()) != 3:
+            continue
+        packages[name.strip()] = int(cumulative) / 1e6
+    return dict(sorted(packages.items(), key=lambda p: -p[1])[:top])
+
+
+def measure(root, runs):
+    results = {}
+    for script in SCRIPTS:
+        path = os.path.join(root, script)
+        try:
+            results[script] = {'seconds': import_seconds(path, runs), 'heaviest': heaviest_imports(path)}
+        except RuntimeError as e:
+            results[script] = {'error': str(e)}
+    return results
+
+
+def checkout(revision, directory):
+    for script in SCRIPTS:
+        target = os.path.join(directory, script)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(subprocess.run(['git', 'show', '{}:{}'.format(revision, script)], cwd=ROOT,
+                                   capture_output=True, check=True).stdout)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='imports per script, the median is reported')
+    parser.add_argument('--baseline', default=None, help='git revision to compare against')
+    parser.add_argument('--output', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    report = {'current': measure(ROOT, args.runs)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as directory:
+            checkout(args.baseline, directory)
+            report['baseline'] = measure(directory, args.runs)
+
+    for script, current in report['current'].items():
+        line = "{:<26} {}".format(script, "{:.3f}s".format(current['seconds']) if 'seconds' in current
+                                  else current['error'])
+        baseline = report.get('baseline', {}).get(script, {})
+        if 'seconds' in baseline and 'seconds' in current:
+            line += "  (baseline {:.3f}s, {:+.3f}s)".format(baseline['seconds'], current['seconds'] - baseline['seconds'])
+        print(line)
+        for package, seconds in current.get('heaviest', {}).items():
+            print("    {:<24} {:.3f}s".format(package, seconds))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)